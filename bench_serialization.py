@@ -0,0 +1,87 @@
+"""
+Benchmark response serialization CPU and bytes on the wire
+"""
+import json
+import os
+import sys
+import timeit
+
+import orjson
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.compression import ENCODERS
+
+CHAT_RESPONSE = {
+    "response": (
+        "I hear you. Anxiety is the gap between the now and the then. "
+        "**If you are in the now, there is no anxiety.** "
+        "Try this: close your eyes, notice three breaths, and simply watch. "
+    ) * 4,
+    "emotion": "anxiety",
+    "insight": None,
+    "practice": None,
+    "emotion_scores": {
+        "emotion": "anxiety",
+        "confidence": 0.6132,
+        "scores": {label: 0.0612 for label in (
+            "sadness", "anxiety", "confusion", "loneliness", "anger",
+            "meaninglessness", "overthinking", "peace", "curiosity"
+        )},
+        "labels": ["anxiety"],
+        "method": "embedding"
+    }
+}
+
+BATCH_RESPONSE = {"results": [CHAT_RESPONSE["emotion_scores"]] * 200}
+
+STREAM_EVENTS = [{"chunk": i, "emotion": "anxiety", "confidence": 0.61} for i in range(50)]
+
+
+def time_per_call(func, number: int = 2000) -> float:
+    """
+    Microseconds per call
+    """
+    return timeit.timeit(func, number=number) / number * 1e6
+
+
+def wire_bytes(body: bytes, encoding: str) -> int:
+    encoder = ENCODERS[encoding]()
+    return len(encoder.compress(body) + encoder.finish())
+
+
+def streamed_wire_bytes(events, encoding: str) -> int:
+    # Per-event flush, as CompressionMiddleware does for NDJSON/SSE
+    encoder = ENCODERS[encoding]()
+    total = 0
+    for event in events:
+        total += len(encoder.compress(orjson.dumps(event) + b"\n") + encoder.flush())
+    return total + len(encoder.finish())
+
+
+def main():
+    print("Serialization (microseconds per call)")
+    print("-" * 50)
+    for name, payload in (("chat", CHAT_RESPONSE), ("batch", BATCH_RESPONSE)):
+        stdlib = time_per_call(lambda: json.dumps(payload).encode())
+        fast = time_per_call(lambda: orjson.dumps(payload))
+        print(f"{name:8} json {stdlib:9.1f}   orjson {fast:9.1f}   x{stdlib / fast:.1f}")
+
+    print("\nBytes on the wire")
+    print("-" * 50)
+    bodies = {
+        "chat": orjson.dumps(CHAT_RESPONSE),
+        "batch": orjson.dumps(BATCH_RESPONSE),
+    }
+    for name, body in bodies.items():
+        sizes = "   ".join(f"{enc} {wire_bytes(body, enc):7}" for enc in ENCODERS)
+        print(f"{name:8} raw {len(body):7}   {sizes}")
+
+    raw_stream = sum(len(orjson.dumps(event)) + 1 for event in STREAM_EVENTS)
+    sizes = "   ".join(f"{enc} {streamed_wire_bytes(STREAM_EVENTS, enc):7}" for enc in ENCODERS)
+    print(f"{'ndjson':8} raw {raw_stream:7}   {sizes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,33 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel
 from typing import Optional, List
+import hmac
 import httpx
+import orjson
 import os
+import time
 from dotenv import load_dotenv
 from services.emotion_detector import EmotionDetector
+from services.emotion_classifier import EmbeddingEmotionClassifier
 from services.vector_store import OshoVectorStore
 from services.groq_service import GroqService
 from services.prompt_builder import PromptBuilder
+from services.journal_pipeline import JournalPipeline
+from services.corpus_reloader import CorpusReloader
+from services.prefetch_cache import PrefetchCache
+from services.profiler import ProfilingMiddleware, profiler, run_in_executor, span
+from services.compression import CompressionMiddleware
+from services.structured_log import RequestContextMiddleware, logger
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="OSHO AI - Awareness Companion")
+app = FastAPI(
+    title="OSHO AI - Awareness Companion",
+    default_response_class=ORJSONResponse
+)
 
 # CORS Configuration
 app.add_middleware(
@@ -24,23 +38,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON/NDJSON/SSE responses above the size threshold
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", 500))
+)
+
+# Request ids for structured log records
+app.add_middleware(RequestContextMiddleware)
+
+# Opt-in per-request profiling (PROFILE_SAMPLE_RATE, or X-Profile with X-Admin-Token)
+app.add_middleware(ProfilingMiddleware)
+
 # Initialize services
 emotion_detector = EmotionDetector()
 vector_store = OshoVectorStore()
 groq_service = GroqService()
 prompt_builder = PromptBuilder()
+emotion_classifier = EmbeddingEmotionClassifier(vector_store.embed, emotion_detector)
+journal_pipeline = JournalPipeline(vector_store, emotion_classifier, groq_service, prompt_builder)
+corpus_reloader = CorpusReloader(vector_store)
+prefetch_cache = PrefetchCache()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    corpus_reloader.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await corpus_reloader.stop()
+    profiler.close()
+    logger.close()
+
+def require_admin(token: Optional[str]):
+    """
+    Admin endpoints are disabled unless ADMIN_TOKEN is set
+    """
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token or not token or not hmac.compare_digest(token.encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
 
 # Request/Response Models
 class ChatRequest(BaseModel):
     message: str
     language: Optional[str] = "en"
     conversation_history: Optional[List[dict]] = []
+    draft_key: Optional[str] = None
+
+class PrefetchRequest(BaseModel):
+    draft: str
+    draft_key: str
 
 class ChatResponse(BaseModel):
     response: str
     emotion: Optional[str] = None
     insight: Optional[dict] = None
     practice: Optional[dict] = None
+    emotion_scores: Optional[dict] = None
+
+class EmotionBatchRequest(BaseModel):
+    messages: List[str]
 
 class HealthResponse(BaseModel):
     status: str
@@ -61,6 +118,55 @@ async def health_check():
         vector_db_ready=vector_store.is_ready()
     )
 
+def retrieve_context(message: str, top_k: int) -> dict:
+    """
+    Embed the message once, classify its emotion and retrieve teachings.
+    The result records the index version it was retrieved from.
+    """
+    version = vector_store.version
+    try:
+        query_embedding = vector_store.embed([message])[0]
+    except Exception as e:
+        # Degrade like a failed search: keyword emotion, no teachings
+        logger.error("vector.embed", error=e, stage="retrieve")
+        return {
+            "emotion_result": emotion_classifier.keyword_result(message),
+            "teachings": [],
+            "version": version
+        }
+    
+    emotion_result = emotion_classifier.classify(message, query_embedding)
+    teachings = vector_store.search(
+        message, emotion_result["emotion"], top_k=top_k, query_embedding=query_embedding
+    )
+    return {"emotion_result": emotion_result, "teachings": teachings, "version": version}
+
+# Speculative Retrieval While Typing
+@app.post("/prefetch")
+async def prefetch(request: PrefetchRequest):
+    """
+    Run emotion detection and retrieval for a draft so the final /chat can skip them.
+    Idempotent: repeating the same draft for the same key does no extra work.
+    """
+    if prefetch_cache.get(request.draft_key, request.draft, vector_store.version):
+        return {"status": "cached"}
+    
+    try:
+        started = time.perf_counter()
+        context = await run_in_executor(lambda: retrieve_context(request.draft, top_k=3), "prefetch.retrieve")
+        compute_ms = (time.perf_counter() - started) * 1000
+        
+        prefetch_cache.put(request.draft_key, request.draft, context["version"], context, compute_ms)
+        return {"status": "prefetched", "emotion": context["emotion_result"]["emotion"]}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error prefetching: {str(e)}")
+
+@app.get("/prefetch/stats")
+async def prefetch_stats(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return prefetch_cache.stats()
+
 # Main Chat Endpoint
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
@@ -68,27 +174,38 @@ async def chat(request: ChatRequest):
     Main chat endpoint - processes user input and returns awareness-based response
     """
     try:
-        # Step 1: Detect emotion
-        emotion = emotion_detector.detect(request.message)
+        # Steps 1-2: Detect emotion and retrieve teachings, unless /prefetch already did
+        with span("chat.retrieve") as stage:
+            context = None
+            if request.draft_key:
+                context = prefetch_cache.take(request.draft_key, request.message, vector_store.version)
+            stage.set(prefetched=context is not None)
+            if context is None:
+                context = retrieve_context(request.message, top_k=3)
         
-        # Step 2: Retrieve relevant Osho teachings
-        teachings = vector_store.search(request.message, emotion, top_k=3)
+        emotion_result = context["emotion_result"]
+        emotion = emotion_result["emotion"]
+        teachings = context["teachings"]
         
         # Step 3: Build MCP-based prompt
-        system_prompt = prompt_builder.build_system_prompt()
-        user_prompt = prompt_builder.build_user_prompt(
-            message=request.message,
-            emotion=emotion,
-            teachings=teachings,
-            language=request.language
-        )
+        with span("chat.build_prompt") as stage:
+            prompt = prompt_builder.render(
+                "chat",
+                message=request.message,
+                emotion=emotion,
+                teachings=teachings,
+                language=request.language,
+                conversation_history=request.conversation_history
+            )
+            stage.set(tokens=prompt.tokens, dropped_teachings=prompt.dropped_teachings)
         
         # Step 4: Get response from Groq
-        response = await groq_service.generate(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            conversation_history=request.conversation_history
-        )
+        with span("chat.generate"):
+            response = await groq_service.generate(
+                system_prompt=prompt.system,
+                user_prompt=prompt.user,
+                conversation_history=request.conversation_history
+            )
         
         # Step 5: Parse and structure response
         parsed_response = prompt_builder.parse_response(response)
@@ -97,7 +214,8 @@ async def chat(request: ChatRequest):
             response=parsed_response.get("text", response),
             emotion=emotion,
             insight=parsed_response.get("insight"),
-            practice=parsed_response.get("practice")
+            practice=parsed_response.get("practice"),
+            emotion_scores=emotion_result
         )
         
     except Exception as e:
@@ -110,91 +228,192 @@ async def journal_reflection(request: ChatRequest):
     Journal mode - provides deeper reflection on user's written thoughts
     """
     try:
+        # Long entries go through the chunked map-reduce pipeline
+        if journal_pipeline.is_long(request.message):
+            return await journal_pipeline.reflect(request.message, request.language)
+        
         # Similar to chat but with journal-specific prompt
-        emotion = emotion_detector.detect(request.message)
-        teachings = vector_store.search(request.message, emotion, top_k=2)
+        with span("journal.retrieve"):
+            context = retrieve_context(request.message, top_k=2)
+        emotion = context["emotion_result"]["emotion"]
         
-        system_prompt = prompt_builder.build_journal_prompt()
-        user_prompt = prompt_builder.build_user_prompt(
-            message=request.message,
-            emotion=emotion,
-            teachings=teachings,
-            language=request.language
-        )
+        with span("journal.build_prompt") as stage:
+            prompt = prompt_builder.render(
+                "journal",
+                message=request.message,
+                emotion=emotion,
+                teachings=context["teachings"],
+                language=request.language
+            )
+            stage.set(tokens=prompt.tokens, dropped_teachings=prompt.dropped_teachings)
         
-        response = await groq_service.generate(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt
-        )
+        with span("journal.generate"):
+            response = await groq_service.generate(
+                system_prompt=prompt.system,
+                user_prompt=prompt.user
+            )
         
         return {"reflection": response, "emotion": emotion}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing journal: {str(e)}")
 
+# Batch Emotion Scoring
+@app.post("/emotions/batch")
+async def score_emotions(request: EmotionBatchRequest):
+    """
+    Score emotions for many messages with one embedding call, run in the
+    thread pool so a large batch does not stall the event loop
+    """
+    max_messages = int(os.getenv("EMOTION_BATCH_MAX_MESSAGES", 256))
+    if len(request.messages) > max_messages:
+        raise HTTPException(status_code=413, detail=f"At most {max_messages} messages per batch")
+    
+    def score():
+        embeddings = vector_store.embed(request.messages) if request.messages else None
+        return emotion_classifier.classify_batch(request.messages, embeddings)
+    
+    try:
+        return {"results": await run_in_executor(score, "emotions.batch")}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error scoring emotions: {str(e)}")
+
+# Teaching Index Admin
+@app.get("/admin/index")
+async def index_status(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return {
+        "version": vector_store.version,
+        "versions": vector_store.versions(),
+        "scope": corpus_reloader.scope
+    }
+
+@app.post("/admin/index/reload")
+async def reload_index(x_admin_token: Optional[str] = Header(None)):
+    """
+    Rebuild the index from the teaching corpus file; in-flight searches finish on the old version.
+    With SHARED_INDEX_DIR every worker switches; otherwise only the worker serving this
+    request does, and the others follow through their own corpus file watcher.
+    """
+    require_admin(x_admin_token)
+    try:
+        return {"version": await corpus_reloader.reload(), "scope": corpus_reloader.scope}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reloading index: {str(e)}")
+
+@app.post("/admin/index/rollback/{version}")
+async def rollback_index(version: int, x_admin_token: Optional[str] = Header(None)):
+    """
+    Make a retained version live again. Requires SHARED_INDEX_DIR: without it
+    versions are per worker, and a worker cannot tell how many siblings it has.
+    """
+    require_admin(x_admin_token)
+    if corpus_reloader.scope == "worker":
+        raise HTTPException(
+            status_code=409,
+            detail="Rollback requires SHARED_INDEX_DIR"
+        )
+    try:
+        return {"version": await corpus_reloader.rollback(version), "scope": corpus_reloader.scope}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
+# Prompt Token Accounting
+@app.get("/admin/prompts")
+async def prompt_stats(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return prompt_builder.stats()
+
+# Profiling Traces
+@app.get("/admin/traces")
+async def list_traces(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return {"traces": profiler.summaries()}
+
+@app.get("/admin/traces/{trace_id}")
+async def get_trace(trace_id: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    Chrome trace-event JSON; open in chrome://tracing or Perfetto
+    """
+    require_admin(x_admin_token)
+    trace = profiler.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace.to_chrome()
+
+# Meditation practices are static, so serialize them once at import
+PRACTICES = {
+    "anxiety": {
+        "title": "Watching the Breath",
+        "steps": [
+            "Sit comfortably and close your eyes",
+            "Notice your breath without changing it",
+            "When anxiety comes, just watch it like a cloud",
+            "Return to the breath gently"
+        ]
+    },
+    "sadness": {
+        "title": "Allowing the Feeling",
+        "steps": [
+            "Find a quiet space",
+            "Let the sadness be there without fighting it",
+            "Feel where it sits in your body",
+            "Breathe into that space with kindness"
+        ]
+    },
+    "anger": {
+        "title": "Witnessing the Fire",
+        "steps": [
+            "Notice the anger without acting on it",
+            "Feel the heat in your body",
+            "Watch it like you're watching a storm",
+            "Let it pass through without holding on"
+        ]
+    },
+    "confusion": {
+        "title": "Sitting with Not Knowing",
+        "steps": [
+            "Sit in silence for 5 minutes",
+            "Don't try to find answers",
+            "Just be with the confusion",
+            "Notice the space between thoughts"
+        ]
+    }
+}
+
+DEFAULT_PRACTICE = {
+    "title": "Simple Awareness",
+    "steps": [
+        "Close your eyes",
+        "Notice what you're feeling",
+        "Don't judge it",
+        "Just observe"
+    ]
+}
+
+PRACTICE_PAYLOADS = {emotion: orjson.dumps(practice) for emotion, practice in PRACTICES.items()}
+DEFAULT_PRACTICE_PAYLOAD = orjson.dumps(DEFAULT_PRACTICE)
+
+ROOT_PAYLOAD = orjson.dumps({
+    "app": "OSHO AI - Awareness Companion",
+    "version": "1.0.0",
+    "status": "running"
+})
+
 # Get Meditation Practices
 @app.get("/practices/{emotion}")
 async def get_practices(emotion: str):
     """
     Get meditation/awareness practices for specific emotion
     """
-    practices = {
-        "anxiety": {
-            "title": "Watching the Breath",
-            "steps": [
-                "Sit comfortably and close your eyes",
-                "Notice your breath without changing it",
-                "When anxiety comes, just watch it like a cloud",
-                "Return to the breath gently"
-            ]
-        },
-        "sadness": {
-            "title": "Allowing the Feeling",
-            "steps": [
-                "Find a quiet space",
-                "Let the sadness be there without fighting it",
-                "Feel where it sits in your body",
-                "Breathe into that space with kindness"
-            ]
-        },
-        "anger": {
-            "title": "Witnessing the Fire",
-            "steps": [
-                "Notice the anger without acting on it",
-                "Feel the heat in your body",
-                "Watch it like you're watching a storm",
-                "Let it pass through without holding on"
-            ]
-        },
-        "confusion": {
-            "title": "Sitting with Not Knowing",
-            "steps": [
-                "Sit in silence for 5 minutes",
-                "Don't try to find answers",
-                "Just be with the confusion",
-                "Notice the space between thoughts"
-            ]
-        }
-    }
-    
-    return practices.get(emotion.lower(), {
-        "title": "Simple Awareness",
-        "steps": [
-            "Close your eyes",
-            "Notice what you're feeling",
-            "Don't judge it",
-            "Just observe"
-        ]
-    })
+    payload = PRACTICE_PAYLOADS.get(emotion.lower(), DEFAULT_PRACTICE_PAYLOAD)
+    return Response(content=payload, media_type="application/json")
 
 # Root endpoint
 @app.get("/")
 async def root():
-    return {
-        "app": "OSHO AI - Awareness Companion",
-        "version": "1.0.0",
-        "status": "running"
-    }
+    return Response(content=ROOT_PAYLOAD, media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,189 @@
+import zlib
+from typing import Callable, Dict, Optional
+
+# Optional encoders: used when installed, otherwise gzip only
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    b"application/json",
+    b"application/x-ndjson",
+    b"text/",
+)
+
+# Streaming types are flushed per event so clients see each one immediately
+STREAMING_TYPES = (b"text/event-stream", b"application/x-ndjson")
+
+
+class _Encoder:
+    """
+    Incremental encoder with a per-chunk flush and a final finish
+    """
+
+    def __init__(self, compress: Callable[[bytes], bytes], flush: Callable[[], bytes], finish: Callable[[], bytes]):
+        self.compress = compress
+        self.flush = flush
+        self.finish = finish
+
+
+def _gzip_encoder() -> _Encoder:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return _Encoder(
+        compressor.compress,
+        lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+        compressor.flush
+    )
+
+
+def _brotli_encoder() -> _Encoder:
+    compressor = brotli.Compressor(quality=5)
+    return _Encoder(compressor.process, compressor.flush, compressor.finish)
+
+
+def _zstd_encoder() -> _Encoder:
+    compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    return _Encoder(
+        compressor.compress,
+        lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+        compressor.flush
+    )
+
+
+# Preference order when the client accepts several
+ENCODERS: Dict[str, Callable[[], _Encoder]] = {}
+if brotli:
+    ENCODERS["br"] = _brotli_encoder
+if zstandard:
+    ENCODERS["zstd"] = _zstd_encoder
+ENCODERS["gzip"] = _gzip_encoder
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the preferred available encoding the client accepts (q=0 means refused)
+    """
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip())
+
+    for encoding in ENCODERS:
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Plain ASGI response compression. Whole bodies below minimum_size are sent
+    as-is, and chunked bodies are buffered until minimum_size bytes have arrived
+    or the response ends. NDJSON/SSE streams are decided on their first message,
+    like Starlette's GZipMiddleware, then compressed and flushed per message so
+    every event reaches the client immediately.
+    """
+
+    def __init__(self, app, minimum_size: int = 500):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        responder = _CompressedResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressedResponder:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.buffer = bytearray()
+        self.encoder: Optional[_Encoder] = None
+        self.passthrough = False
+        self.streaming_type = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            headers = dict(message.get("headers", []))
+            content_type = headers.get(b"content-type", b"")
+            self.passthrough = (
+                b"content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            )
+            self.streaming_type = content_type.startswith(STREAMING_TYPES)
+            if self.passthrough:
+                return await self._send(message)
+            # Hold the headers until enough body has arrived to decide
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body":
+            return await self._send(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            if not self.streaming_type:
+                # Chunked bodies are held until minimum_size bytes arrive or the
+                # response ends; SSE/NDJSON events are never held back
+                self.buffer += body
+                if more_body and len(self.buffer) < self.minimum_size:
+                    return
+                body, self.buffer = bytes(self.buffer), bytearray()
+
+            start, self.start_message = self.start_message, None
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self._send(start)
+                return await self._send({"type": "http.response.body", "body": body, "more_body": False})
+
+            self.encoder = ENCODERS[self.encoding]()
+            if not more_body:
+                compressed = self.encoder.compress(body) + self.encoder.finish()
+                await self._send(self._compressed_start(start, len(compressed)))
+                return await self._send({"type": "http.response.body", "body": compressed, "more_body": False})
+            await self._send(self._compressed_start(start, None))
+
+        if self.passthrough:
+            return await self._send(message)
+
+        if more_body:
+            chunk = self.encoder.compress(body)
+            if self.streaming_type:
+                chunk += self.encoder.flush()
+            if not chunk:
+                return
+        else:
+            chunk = self.encoder.compress(body) + self.encoder.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def _compressed_start(self, start: Dict, content_length: Optional[int]) -> Dict:
+        headers = [
+            (name, value) for name, value in start.get("headers", [])
+            if name.lower() not in (b"content-length", b"vary")
+        ]
+        vary = [value for name, value in start.get("headers", []) if name.lower() == b"vary"]
+        headers.append((b"content-encoding", self.encoding.encode()))
+        headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode()))
+        return {**start, "headers": headers}
@@ -0,0 +1,83 @@
+import asyncio
+import contextlib
+import os
+from typing import Optional
+
+from services.vector_store import load_teachings
+from services.structured_log import logger
+
+
+class CorpusReloader:
+    """
+    Rebuilds the teaching index in the background when the corpus file changes.
+
+    In shared mode (SHARED_INDEX_DIR) a rebuild is published to every worker.
+    Without it each worker owns its index, so every worker runs this watcher
+    and picks up a corpus edit on its own next poll.
+    """
+
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+        self.path = vector_store.teachings_path
+        self.interval = float(os.getenv("TEACHINGS_WATCH_INTERVAL", 5))
+        self._mtime = self._current_mtime()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def scope(self) -> str:
+        """
+        Which workers a reload or rollback through this process reaches
+        """
+        return "all_workers" if self.vector_store.shared_index else "worker"
+
+    def _current_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    async def reload(self) -> int:
+        """
+        Build a new index version off the event loop and swap it in
+        Returns the version now live
+        """
+        loop = asyncio.get_event_loop()
+        mtime = self._current_mtime()
+        version = await loop.run_in_executor(
+            None,
+            lambda: self.vector_store.rebuild(load_teachings(self.path))
+        )
+        # Only mark this mtime handled once it loaded; a file caught half-written
+        # fails to parse and is retried on the next poll
+        self._mtime = mtime
+        return version
+
+    async def rollback(self, version: int) -> int:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, lambda: self.vector_store.rollback(version))
+
+    def start(self):
+        """
+        Start polling the corpus file (disabled when TEACHINGS_WATCH_INTERVAL is 0)
+        """
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            mtime = self._current_mtime()
+            if mtime is None or mtime == self._mtime:
+                continue
+            try:
+                version = await self.reload()
+                logger.info("index.reload", stage="reload", version=version)
+            except Exception as e:
+                logger.error("index.reload", error=e, stage="reload")
@@ -0,0 +1,127 @@
+import os
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from services.emotion_detector import EmotionDetector
+
+
+class EmbeddingEmotionClassifier:
+    """
+    Scores emotions from the query embedding already computed for retrieval.
+    It abstains (and falls back to keyword matching, which answers "neutral"
+    when no keyword fires) unless the embedding is confident, clearly ahead of
+    the runner-up and, for prototypes, actually close to the winning centroid.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], np.ndarray],
+        keyword_detector: EmotionDetector,
+        min_confidence: float = 0.35,
+        min_margin: float = 0.1,
+        min_similarity: float = 0.35,
+        label_threshold: float = 0.2,
+        temperature: float = 0.05
+    ):
+        self.keyword_detector = keyword_detector
+        self.min_confidence = float(os.getenv("EMOTION_MIN_CONFIDENCE", min_confidence))
+        self.min_margin = float(os.getenv("EMOTION_MIN_MARGIN", min_margin))
+        self.min_similarity = float(os.getenv("EMOTION_MIN_SIMILARITY", min_similarity))
+        self.label_threshold = label_threshold
+        self.temperature = temperature
+
+        # Optional trained linear head: an .npz with weights (E x D), bias (E,) and labels (E,)
+        head_path = os.getenv("EMOTION_HEAD_PATH")
+        if head_path:
+            head = np.load(head_path)
+            self.labels = [str(label) for label in head["labels"]]
+            self.weights = head["weights"].astype(np.float32)
+            self.bias = head["bias"].astype(np.float32)
+            self.uses_prototypes = False
+        else:
+            self.labels, self.weights = self._build_prototypes(embed)
+            self.bias = np.zeros(len(self.labels), dtype=np.float32)
+            self.uses_prototypes = True
+
+    def _build_prototypes(self, embed: Callable[[List[str]], np.ndarray]):
+        """
+        One unit-length centroid per emotion from its keyword phrases
+        """
+        labels = list(self.keyword_detector.emotion_keywords)
+        phrases = [phrase for label in labels for phrase in self.keyword_detector.emotion_keywords[label]]
+        vectors = _normalize(np.asarray(embed(phrases), dtype=np.float32))
+
+        centroids = []
+        start = 0
+        for label in labels:
+            count = len(self.keyword_detector.emotion_keywords[label])
+            centroids.append(vectors[start:start + count].mean(axis=0))
+            start += count
+
+        return labels, _normalize(np.stack(centroids))
+
+    def keyword_result(self, text: str) -> Dict:
+        """
+        Keyword-only result, for when no embedding is available
+        """
+        return {
+            "emotion": self.keyword_detector.detect(text),
+            "confidence": 0.0,
+            "scores": {},
+            "labels": [],
+            "method": "keyword"
+        }
+
+    def classify(self, text: str, embedding: np.ndarray) -> Dict:
+        """
+        Classify one message from its retrieval embedding
+        """
+        return self.classify_batch([text], np.asarray(embedding)[None, :])[0]
+
+    def classify_batch(self, texts: List[str], embeddings: np.ndarray) -> List[Dict]:
+        """
+        Classify many messages with a single matrix product
+        Returns per message: emotion, confidence, scores, labels and method
+        """
+        if not texts:
+            return []
+
+        queries = _normalize(np.asarray(embeddings, dtype=np.float32))
+        raw = queries @ self.weights.T + self.bias
+        logits = raw / self.temperature
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+
+        results = []
+        for text, row, raw_row in zip(texts, probs, raw):
+            ranked = np.argsort(row)[::-1]
+            best = int(ranked[0])
+            confidence = float(row[best])
+            margin = confidence - float(row[ranked[1]]) if len(ranked) > 1 else confidence
+            scores = {label: round(float(p), 4) for label, p in zip(self.labels, row)}
+            labels = [label for label, p in zip(self.labels, row) if p >= self.label_threshold]
+
+            # For prototypes the raw score is the cosine to the winning centroid
+            close_enough = not self.uses_prototypes or float(raw_row[best]) >= self.min_similarity
+            if confidence >= self.min_confidence and margin >= self.min_margin and close_enough:
+                emotion, method = self.labels[best], "embedding"
+            else:
+                # Confidence is for the label returned, not the rejected top label
+                emotion, method = self.keyword_detector.detect(text), "keyword"
+                confidence = float(row[self.labels.index(emotion)]) if emotion in self.labels else 0.0
+
+            results.append({
+                "emotion": emotion,
+                "confidence": round(confidence, 4),
+                "scores": scores,
+                "labels": labels,
+                "method": method
+            })
+        return results
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
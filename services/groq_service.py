@@ -1,7 +1,9 @@
 import os
+import time
 from typing import List, Optional
 from groq import Groq
-import asyncio
+from services.profiler import run_in_executor
+from services.structured_log import logger
 
 class GroqService:
     """
@@ -24,29 +26,32 @@ class GroqService:
         """
         try:
             # Run the synchronous Groq call in a thread pool
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
+            response = await run_in_executor(
                 lambda: self.client.chat.completions.create(
                     model=self.model,
                     messages=[{"role": "user", "content": "test"}],
                     max_tokens=5
-                )
+                ),
+                "groq.check_connection"
             )
             return True
         except Exception as e:
-            print(f"Groq connection check failed: {e}")
+            logger.warning("groq.check_connection", error=e, stage="health", backend="groq")
             return False
     
     async def generate(
         self, 
         system_prompt: str, 
         user_prompt: str,
-        conversation_history: Optional[List[dict]] = None
+        conversation_history: Optional[List[dict]] = None,
+        max_tokens: int = 500,
+        fallback: bool = True
     ) -> str:
         """
         Generate response from Groq API
+        With fallback=False errors are raised instead of returning the fallback text
         """
+        started = time.perf_counter()
         try:
             # Build messages
             messages = [
@@ -61,16 +66,15 @@ class GroqService:
             messages.append({"role": "user", "content": user_prompt})
             
             # Call Groq API in a thread pool (since Groq SDK is synchronous)
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
+            response = await run_in_executor(
                 lambda: self.client.chat.completions.create(
                     model=self.model,
                     messages=messages,
                     temperature=0.7,
                     top_p=0.9,
-                    max_tokens=500
-                )
+                    max_tokens=max_tokens
+                ),
+                "groq.completion"
             )
             
             # Extract the response content
@@ -80,7 +84,12 @@ class GroqService:
                 raise Exception("No response from Groq API")
                     
         except Exception as e:
-            print(f"Groq API error: {e}")
+            logger.error(
+                "groq.generate", error=e, stage="generate", backend="groq",
+                model=self.model, latency_ms=round((time.perf_counter() - started) * 1000, 1)
+            )
+            if not fallback:
+                raise
             # Fallback response if Groq fails
             return self._fallback_response()
     
@@ -0,0 +1,212 @@
+import asyncio
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from services.profiler import run_in_executor, span
+from services.structured_log import logger
+
+# Sentence ends: Latin punctuation plus the Devanagari danda for Hindi entries
+_SENTENCE_END = re.compile(r"(?<=[.!?।])\s+|\n{2,}")
+
+
+def iter_chunks(text: str, max_chars: int = 800) -> Iterator[str]:
+    """
+    Yield sentence-aligned chunks of at most max_chars
+    A single sentence longer than max_chars is split on whitespace
+    """
+    current = ""
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                yield current
+                current = ""
+            yield sentence[:cut].strip()
+            sentence = sentence[cut:].strip()
+
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            yield current
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+
+    if current:
+        yield current
+
+
+class JournalPipeline:
+    """
+    Map-reduce reflection for long journal entries: per-chunk emotion,
+    retrieval and summary, then one final reflection call
+    """
+
+    def __init__(self, vector_store, emotion_classifier, groq_service, prompt_builder):
+        self.vector_store = vector_store
+        self.emotion_classifier = emotion_classifier
+        self.groq_service = groq_service
+        self.prompt_builder = prompt_builder
+
+        self.threshold_chars = int(os.getenv("JOURNAL_LONG_THRESHOLD", 2000))
+        self.chunk_chars = int(os.getenv("JOURNAL_CHUNK_CHARS", 800))
+        self.max_concurrency = int(os.getenv("JOURNAL_MAX_CONCURRENCY", 4))
+        self.max_chunks = max(1, int(os.getenv("JOURNAL_MAX_CHUNKS", 16)))
+        self.summary_fallback_chars = 300
+
+    def is_long(self, text: str) -> bool:
+        return len(text) >= self.threshold_chars
+
+    async def reflect(self, message: str, language: Optional[str] = "en") -> Dict:
+        """
+        Reflect on a long entry
+        """
+        chunks = self._chunk(message)
+
+        # Map runs in the thread pool: embedding every chunk would stall the event loop
+        emotions, chunk_teachings = await run_in_executor(lambda: self._map(chunks), "journal.map")
+
+        with span("journal.summarize", chunks=len(chunks)):
+            summaries = await self._summarize(chunks)
+
+        # Reduce: one final reflection over the section summaries
+        emotion = self._dominant_emotion(emotions)
+        teachings = self._rank_teachings(chunk_teachings)
+        sections = [
+            (i, i, f"Section {i} ({result['emotion']})", summary)
+            for i, (result, summary) in enumerate(zip(emotions, summaries), 1)
+        ]
+        prompt = self._render_reduce(sections, emotion, teachings, language)
+
+        # Hierarchical reduce: halve the sections until the overview fits the journal budget
+        while prompt.over_budget and len(sections) > 1:
+            with span("journal.condense", sections=len(sections)):
+                sections = await self._condense(sections)
+            prompt = self._render_reduce(sections, emotion, teachings, language)
+
+        with span("journal.reduce", tokens=prompt.tokens):
+            response = await self.groq_service.generate(
+                system_prompt=prompt.system,
+                user_prompt=prompt.user
+            )
+
+        return {
+            "reflection": response,
+            "emotion": emotion,
+            "emotion_trajectory": [
+                {"chunk": i, "emotion": result["emotion"], "confidence": result["confidence"]}
+                for i, result in enumerate(emotions)
+            ]
+        }
+
+    def _chunk(self, message: str) -> List[str]:
+        """
+        Sentence-aligned chunks, grown beyond chunk_chars when needed so an entry
+        never makes more than max_chunks summary calls
+        """
+        chars = self.chunk_chars
+        chunks = list(iter_chunks(message, chars))
+        while len(chunks) > self.max_chunks:
+            chars = max(chars + 1, math.ceil(chars * len(chunks) / self.max_chunks))
+            chunks = list(iter_chunks(message, chars))
+        return chunks
+
+    async def _condense(self, sections: List[Tuple]) -> List[Tuple]:
+        """
+        Summarize adjacent pairs of (first, last, label, summary) sections into one
+        each; an odd last section is carried over as it is
+        """
+        pairs = [sections[i:i + 2] for i in range(0, len(sections) - 1, 2)]
+        merged = await self._summarize([
+            "\n".join(f"{label}: {summary}" for _, _, label, summary in pair) for pair in pairs
+        ])
+        condensed = [
+            (pair[0][0], pair[1][1], f"Sections {pair[0][0]}-{pair[1][1]}", summary)
+            for pair, summary in zip(pairs, merged)
+        ]
+        return condensed + sections[len(pairs) * 2:]
+
+    def _render_reduce(self, sections: List[Tuple], emotion: str, teachings: List[Dict], language: Optional[str]):
+        overview = "\n".join(f"{label}: {summary}" for _, _, label, summary in sections)
+        return self.prompt_builder.render(
+            "journal",
+            message=f"(A long journal entry, summarized section by section)\n{overview}",
+            emotion=emotion,
+            teachings=teachings,
+            language=language
+        )
+
+    def _map(self, chunks: List[str]):
+        """
+        One embedding batch, one classifier pass, one retrieval batch
+        """
+        try:
+            embeddings = self.vector_store.embed(chunks)
+        except Exception as e:
+            logger.error("vector.embed", error=e, stage="journal.map")
+            return [self.emotion_classifier.keyword_result(chunk) for chunk in chunks], [[] for _ in chunks]
+
+        emotions = self.emotion_classifier.classify_batch(chunks, embeddings)
+        chunk_teachings = self.vector_store.search_batch(
+            chunks, [result["emotion"] for result in emotions], top_k=2, query_embeddings=embeddings
+        )
+        return emotions, chunk_teachings
+
+    async def _summarize(self, chunks: List[str]) -> List[str]:
+        """
+        Summarize chunks concurrently, at most max_concurrency Groq calls at a time.
+        A chunk whose summary fails is passed on as its own (truncated) text rather
+        than the user-facing fallback reply.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        system_prompt = self.prompt_builder.build_chunk_summary_prompt()
+
+        async def summarize(chunk: str) -> str:
+            async with semaphore:
+                try:
+                    return await self.groq_service.generate(
+                        system_prompt=system_prompt,
+                        user_prompt=chunk,
+                        max_tokens=120,
+                        fallback=False
+                    )
+                except Exception:
+                    if len(chunk) <= self.summary_fallback_chars:
+                        return chunk
+                    return chunk[:self.summary_fallback_chars].rsplit(" ", 1)[0] + "…"
+
+        return await asyncio.gather(*(summarize(chunk) for chunk in chunks))
+
+    def _dominant_emotion(self, emotions: List[Dict]) -> str:
+        """
+        Most common non-neutral emotion across chunks; summed confidence only
+        breaks ties, so one confident chunk cannot outvote several keyword ones
+        """
+        counts = Counter()
+        confidence = Counter()
+        for result in emotions:
+            if result["emotion"] != "neutral":
+                counts[result["emotion"]] += 1
+                confidence[result["emotion"]] += result["confidence"]
+        if not counts:
+            return "neutral"
+        return max(counts, key=lambda emotion: (counts[emotion], confidence[emotion]))
+
+    def _rank_teachings(self, chunk_teachings: List[List[Dict]]) -> List[Dict]:
+        """
+        Deduplicate teachings, ranking by how many chunks retrieved them, then by best rank
+        """
+        seen: Dict[str, Dict] = {}
+        for teachings in chunk_teachings:
+            for rank, teaching in enumerate(teachings):
+                entry = seen.setdefault(teaching["text"], {"teaching": teaching, "hits": 0, "best": rank})
+                entry["hits"] += 1
+                entry["best"] = min(entry["best"], rank)
+
+        ranked = sorted(seen.values(), key=lambda e: (-e["hits"], e["best"]))
+        return [entry["teaching"] for entry in ranked]
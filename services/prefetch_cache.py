@@ -0,0 +1,92 @@
+import difflib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class PrefetchCache:
+    """
+    Short-lived store for emotion and retrieval results computed from a draft
+    message while the user is still typing.
+
+    Entries live in this process only. With several uvicorn workers a /chat
+    usually lands on a different worker than its /prefetch, so expect a hit
+    rate of roughly 1/N unless the proxy pins a client to one worker.
+    """
+
+    def __init__(self):
+        self.ttl = float(os.getenv("PREFETCH_TTL_SECONDS", 30))
+        self.max_entries = int(os.getenv("PREFETCH_MAX_ENTRIES", 1000))
+        self.min_similarity = float(os.getenv("PREFETCH_MIN_SIMILARITY", 0.9))
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def get(self, key: str, draft: str, version: int) -> Optional[Dict]:
+        """
+        Entry already computed for exactly this draft, if still fresh (no stats counted)
+        """
+        entry = self._fresh(key, version)
+        if entry and entry["draft"] == _normalize(draft):
+            return entry
+        return None
+
+    def put(self, key: str, draft: str, version: int, result: Dict, compute_ms: float):
+        self._entries.pop(key, None)
+        self._entries[key] = {
+            "draft": _normalize(draft),
+            "version": version,
+            "result": result,
+            "compute_ms": compute_ms,
+            "expires_at": time.monotonic() + self.ttl
+        }
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def take(self, key: str, message: str, version: int) -> Optional[Dict]:
+        """
+        Consume the prefetched result if the final message matches the draft closely enough
+        """
+        entry = self._fresh(key, version)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        message = _normalize(message)
+        if message != entry["draft"]:
+            similarity = difflib.SequenceMatcher(None, message, entry["draft"]).ratio()
+            if similarity < self.min_similarity:
+                self.misses += 1
+                return None
+
+        del self._entries[key]
+        self.hits += 1
+        self.saved_ms += entry["compute_ms"]
+        return entry["result"]
+
+    def _fresh(self, key: str, version: int) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        # Results from an older index version are stale after a corpus reload
+        if entry["expires_at"] < time.monotonic() or entry["version"] != version:
+            del self._entries[key]
+            return None
+        return entry
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "latency_saved_ms": round(self.saved_ms, 1),
+            "entries": len(self._entries)
+        }
@@ -0,0 +1,251 @@
+import asyncio
+import contextvars
+import glob
+import hmac
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from services.structured_log import logger
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("profile_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("profile_span", default=0)
+
+
+class Trace:
+    """
+    Span tree for one profiled request, exportable as Chrome trace-event JSON
+    """
+
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.origin = time.perf_counter()
+        self.meta: Dict = {"request": name}
+        self.events: List[Dict] = []
+        self._next_id = 0
+        self._id_lock = threading.Lock()
+
+    def new_span_id(self) -> int:
+        with self._id_lock:
+            self._next_id += 1
+            return self._next_id
+
+    def add(self, name: str, start: float, end: float, span_id: int, parent_id: int, args: Dict):
+        # list.append is atomic, so executor threads can record spans directly
+        self.events.append({
+            "name": name,
+            "ph": "X",
+            "ts": round((start - self.origin) * 1e6, 1),
+            "dur": round((end - start) * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {"span_id": span_id, "parent_id": parent_id, **args}
+        })
+
+    def duration_ms(self) -> float:
+        return max((e["ts"] + e["dur"] for e in self.events), default=0.0) / 1000
+
+    def to_chrome(self) -> Dict:
+        return {
+            "traceEvents": self.events,
+            "displayTimeUnit": "ms",
+            "otherData": {"trace_id": self.trace_id, **self.meta}
+        }
+
+
+class _Span:
+    def __init__(self, trace: Trace, name: str, args: Dict):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.span_id = self.trace.new_span_id()
+        self.parent_id = _current_span.get()
+        self._token = _current_span.set(self.span_id)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.trace.add(self.name, self.start, end, self.span_id, self.parent_id, self.args)
+        return False
+
+
+class _NullSpan:
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **args):
+    """
+    Time a block as a child of the current span; a shared no-op when not profiling
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name, args)
+
+
+async def run_in_executor(func: Callable, name: str):
+    """
+    loop.run_in_executor that, when profiling, records thread-pool queue time
+    and runs func inside the request's span context
+    """
+    loop = asyncio.get_event_loop()
+    trace = _current_trace.get()
+    if trace is None:
+        return await loop.run_in_executor(None, func)
+
+    submitted = time.perf_counter()
+    parent_id = _current_span.get()
+
+    def run():
+        trace.add("executor.queue", submitted, time.perf_counter(), trace.new_span_id(), parent_id, {})
+        with span(name):
+            return func()
+
+    return await loop.run_in_executor(None, contextvars.copy_context().run, run)
+
+
+class Profiler:
+    """
+    Decides which requests to trace and keeps finished traces. Exported files
+    are written by a single background thread and capped at PROFILE_MAX_FILES.
+    """
+
+    def __init__(self):
+        self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+        self.output_dir = os.getenv("PROFILE_DIR")
+        self.max_files = int(os.getenv("PROFILE_MAX_FILES", 200))
+        self.recent: deque = deque(maxlen=int(os.getenv("PROFILE_RING_SIZE", 50)))
+        self._writer: Optional[ThreadPoolExecutor] = None
+
+    def should_trace(self, header_value: Optional[bytes], admin_token: Optional[bytes] = None) -> bool:
+        """
+        An X-Profile header only counts with a valid X-Admin-Token, so clients
+        cannot force tracing; everything else is left to sampling
+        """
+        if header_value is not None and self._is_admin(admin_token):
+            return header_value not in (b"0", b"false")
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @staticmethod
+    def _is_admin(token: Optional[bytes]) -> bool:
+        expected = os.getenv("ADMIN_TOKEN")
+        return bool(expected and token and hmac.compare_digest(token, expected.encode()))
+
+    def start(self, name: str) -> Trace:
+        trace = Trace(name)
+
+        # Event-loop lag: how long a callback queued now waits to run
+        scheduled = time.perf_counter()
+
+        def measure_lag():
+            trace.meta["event_loop_lag_ms"] = round((time.perf_counter() - scheduled) * 1000, 3)
+
+        asyncio.get_event_loop().call_soon(measure_lag)
+        return trace
+
+    def finish(self, trace: Trace):
+        self.recent.append(trace)
+        if self.output_dir:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+            self._writer.submit(self._export, trace)
+
+    def _export(self, trace: Trace):
+        """
+        Write one trace file and delete the oldest beyond max_files (writer thread)
+        """
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"trace_{trace.trace_id}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(trace.to_chrome(), f)
+
+            files = sorted(glob.glob(os.path.join(self.output_dir, "trace_*.json")), key=os.path.getmtime)
+            for old in files[:-self.max_files] if self.max_files > 0 else []:
+                os.remove(old)
+        except OSError as e:
+            logger.warning("trace.export", error=e, stage="profiling")
+
+    def close(self):
+        """
+        Wait for queued trace files to be written
+        """
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        for trace in self.recent:
+            if trace.trace_id == trace_id:
+                return trace
+        return None
+
+    def summaries(self) -> List[Dict]:
+        return [
+            {"trace_id": t.trace_id, "request": t.name, "duration_ms": round(t.duration_ms(), 3)}
+            for t in reversed(self.recent)
+        ]
+
+
+profiler = Profiler()
+
+
+class ProfilingMiddleware:
+    """
+    Plain ASGI middleware: opt in with PROFILE_SAMPLE_RATE, or per request with an
+    X-Profile header sent together with X-Admin-Token.
+    Untraced requests pay two header lookups and a random() call.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        if not profiler.should_trace(headers.get(b"x-profile"), headers.get(b"x-admin-token")):
+            return await self.app(scope, receive, send)
+
+        trace = profiler.start(f"{scope['method']} {scope['path']}")
+        token = _current_trace.set(trace)
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-trace-id", trace.trace_id.encode())]
+            await send(message)
+
+        try:
+            with span("request", path=scope["path"]):
+                await self.app(scope, receive, send_with_trace_id)
+        finally:
+            _current_trace.reset(token)
+            profiler.finish(trace)
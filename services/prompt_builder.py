@@ -1,17 +1,10 @@
 from typing import List, Dict, Optional
 import json
+import math
+import os
 import re
 
-class PromptBuilder:
-    """
-    Builds MCP-based prompts for Ollama
-    """
-    
-    def build_system_prompt(self) -> str:
-        """
-        Build the master system prompt (MCP)
-        """
-        return """You are an AI awareness companion inspired by the teachings of Osho.
+MASTER_SYSTEM_PROMPT = """You are an AI awareness companion inspired by the teachings of Osho.
 
 Your purpose is not to advise, fix, or judge — but to help users observe, understand, and become aware of their inner state.
 
@@ -60,11 +53,7 @@ You are not a guru. You are a mirror.
 FORMAT YOUR RESPONSE AS NATURAL TEXT, NOT JSON.
 Keep it conversational and warm."""
 
-    def build_journal_prompt(self) -> str:
-        """
-        Build system prompt for journal mode
-        """
-        return """You are an AI awareness companion for journal reflection.
+JOURNAL_SYSTEM_PROMPT = """You are an AI awareness companion for journal reflection.
 
 The user has written their thoughts and feelings. Your role is to:
 
@@ -77,6 +66,199 @@ Be brief, gentle, and insightful. This is not therapy — it's reflection.
 
 You are a mirror, not a guide."""
 
+CHUNK_SUMMARY_SYSTEM_PROMPT = """You are helping reflect on a long journal entry, one section at a time.
+
+Summarize this section in 2-3 sentences:
+- What the writer is feeling
+- What situation or thought is behind it
+
+Stay close to their words. Do not advise, interpret, or add teachings."""
+
+
+LANGUAGE_INSTRUCTIONS = {
+    "en": "Respond in simple English.",
+    "hi": "Respond in simple Hindi (Devanagari script).",
+}
+
+CLOSING_INSTRUCTION = "Provide a gentle, awareness-based response following the MCP process."
+
+# Default token budgets for the whole request (system + history + user prompt)
+DEFAULT_TOKEN_BUDGETS = {
+    "chat": 1800,
+    "journal": 2400,
+    "chunk_summary": 800,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate: about 4 ASCII characters per token, and about
+    2 characters per token for non-ASCII scripts such as Devanagari
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 2)
+
+
+class PromptTemplate:
+    """
+    One mode x language variant, compiled once. The system prompt and the
+    fixed user-prompt footer are stored as ready strings with their token
+    counts, so rendering only fills the variable slots.
+    """
+
+    def __init__(self, mode: str, language: str, system: str, max_teachings: int = 2):
+        self.mode = mode
+        self.language = language
+        self.system = system
+        self.max_teachings = max_teachings
+        self.footer = f"\n{LANGUAGE_INSTRUCTIONS[language]}\n\n{CLOSING_INSTRUCTION}"
+        self.system_tokens = estimate_tokens(system)
+        self.footer_tokens = estimate_tokens(self.footer)
+        self.token_budget = int(os.getenv(f"PROMPT_TOKEN_BUDGET_{mode.upper()}", DEFAULT_TOKEN_BUDGETS[mode]))
+
+    def render(
+        self,
+        message: str,
+        emotion: Optional[str],
+        teachings: List[Dict],
+        conversation_history: Optional[List[dict]] = None
+    ) -> "RenderedPrompt":
+        """
+        Fill the slots, dropping the lowest-ranked teachings first when over budget
+        """
+        head = f"User's message: {message}\n\nDetected emotion: {emotion or 'neutral'}"
+        history_tokens = sum(
+            estimate_tokens(turn.get("content", "")) for turn in (conversation_history or [])[-6:]
+        )
+        message_tokens = estimate_tokens(head) + self.footer_tokens
+
+        blocks = [
+            f"\n\n{i}. \"{teaching['text']}\"\n   Source: {teaching['source']}"
+            for i, teaching in enumerate(teachings[:self.max_teachings], 1)
+        ]
+        block_tokens = [estimate_tokens(block) for block in blocks]
+        fixed_tokens = self.system_tokens + history_tokens + message_tokens
+
+        # Teachings arrive ranked best-first, so trim from the end
+        while blocks and fixed_tokens + sum(block_tokens) > self.token_budget:
+            blocks.pop()
+            block_tokens.pop()
+        teaching_section = "\n\nRelevant Osho teachings:" + "".join(blocks) if blocks else ""
+
+        return RenderedPrompt(
+            system=self.system,
+            user=f"{head}{teaching_section}\n{self.footer}",
+            tokens={
+                "system": self.system_tokens,
+                "history": history_tokens,
+                "teachings": sum(block_tokens),
+                "message": message_tokens,
+            },
+            budget=self.token_budget,
+            dropped_teachings=min(len(teachings), self.max_teachings) - len(blocks)
+        )
+
+
+class RenderedPrompt:
+    """
+    A rendered prompt pair with per-section token accounting
+    """
+
+    def __init__(self, system: str, user: str, tokens: Dict[str, int], budget: int, dropped_teachings: int):
+        self.system = system
+        self.user = user
+        self.tokens = tokens
+        self.total_tokens = sum(tokens.values())
+        self.budget = budget
+        self.dropped_teachings = dropped_teachings
+
+    @property
+    def over_budget(self) -> bool:
+        return self.total_tokens > self.budget
+
+
+class PromptBuilder:
+    """
+    Builds MCP-based prompts for Ollama
+    """
+    
+    def __init__(self):
+        # Compile every mode x language variant once at startup. System prompts
+        # never depend on the request, so the prefix stays byte-identical and
+        # provider-side prompt caching can hit.
+        system_prompts = {
+            "chat": MASTER_SYSTEM_PROMPT,
+            "journal": JOURNAL_SYSTEM_PROMPT,
+            "chunk_summary": CHUNK_SUMMARY_SYSTEM_PROMPT,
+        }
+        self.templates = {
+            (mode, language): PromptTemplate(mode, language, system)
+            for mode, system in system_prompts.items()
+            for language in LANGUAGE_INSTRUCTIONS
+        }
+        self._stats: Dict[str, Dict] = {}
+    
+    def get_template(self, mode: str, language: Optional[str] = "en") -> PromptTemplate:
+        return self.templates[(mode, language if language in LANGUAGE_INSTRUCTIONS else "en")]
+    
+    def render(
+        self,
+        mode: str,
+        message: str,
+        emotion: Optional[str],
+        teachings: List[Dict],
+        language: Optional[str] = "en",
+        conversation_history: Optional[List[dict]] = None
+    ) -> RenderedPrompt:
+        """
+        Render the system and user prompt for a mode, with token accounting
+        """
+        prompt = self.get_template(mode, language).render(message, emotion, teachings, conversation_history)
+        
+        stats = self._stats.setdefault(mode, {"renders": 0, "dropped_teachings": 0, "over_budget": 0, "tokens": {}})
+        stats["renders"] += 1
+        stats["dropped_teachings"] += prompt.dropped_teachings
+        stats["over_budget"] += int(prompt.over_budget)
+        for section, count in prompt.tokens.items():
+            stats["tokens"][section] = stats["tokens"].get(section, 0) + count
+        return prompt
+    
+    def stats(self) -> Dict:
+        """
+        Per-mode render counts, budgets and average tokens per section
+        """
+        report = {}
+        for mode, stats in self._stats.items():
+            renders = stats["renders"]
+            report[mode] = {
+                "renders": renders,
+                "token_budget": self.get_template(mode).token_budget,
+                "dropped_teachings": stats["dropped_teachings"],
+                "over_budget": stats["over_budget"],
+                "avg_tokens": {section: round(total / renders, 1) for section, total in stats["tokens"].items()},
+            }
+        return report
+    
+    def build_system_prompt(self) -> str:
+        """
+        Build the master system prompt (MCP)
+        """
+        return self.templates[("chat", "en")].system
+
+    def build_journal_prompt(self) -> str:
+        """
+        Build system prompt for journal mode
+        """
+        return self.templates[("journal", "en")].system
+
+    def build_chunk_summary_prompt(self) -> str:
+        """
+        Build system prompt for summarizing one section of a long journal entry
+        """
+        return self.templates[("chunk_summary", "en")].system
+
     def build_user_prompt(
         self,
         message: str,
@@ -87,27 +269,7 @@ You are a mirror, not a guide."""
         """
         Build user prompt with context
         """
-        prompt_parts = [
-            f"User's message: {message}",
-            f"\nDetected emotion: {emotion or 'neutral'}",
-        ]
-        
-        # Add relevant teachings
-        if teachings:
-            prompt_parts.append("\nRelevant Osho teachings:")
-            for i, teaching in enumerate(teachings[:2], 1):
-                prompt_parts.append(f"\n{i}. \"{teaching['text']}\"")
-                prompt_parts.append(f"   Source: {teaching['source']}")
-        
-        # Language instruction
-        if language == "hi":
-            prompt_parts.append("\nRespond in simple Hindi (Devanagari script).")
-        else:
-            prompt_parts.append("\nRespond in simple English.")
-        
-        prompt_parts.append("\nProvide a gentle, awareness-based response following the MCP process.")
-        
-        return "\n".join(prompt_parts)
+        return self.render("chat", message, emotion, teachings, language).user
     
     def parse_response(self, response: str) -> Dict:
         """
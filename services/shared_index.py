@@ -0,0 +1,314 @@
+import fcntl
+import json
+import mmap
+import os
+import shutil
+import struct
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Layout of the shared index directory:
+#   generation          8-byte little-endian counter, mapped by every worker
+#   .lock               flock target for builders / publishers
+#   v<N>/embeddings.npy float32 matrix, memory-mapped read-only by workers
+#   v<N>/sq_norms.npy   squared row norms, so workers never copy the matrix
+#   v<N>/records.json   ids, documents and metadatas in row order, plus a meta
+#                       fingerprint (corpus hash, embedding model) of the build
+_GENERATION_FORMAT = "<Q"
+_GENERATION_SIZE = struct.calcsize(_GENERATION_FORMAT)
+
+IndexRows = Tuple[List[str], np.ndarray, List[str], List[dict]]
+
+
+def _empty_rows() -> IndexRows:
+    return [], np.empty((0, 0), dtype=np.float32), [], []
+
+
+class _IndexView:
+    """
+    One attached version. Swapped as a single reference so a search that
+    already holds a view finishes on it even if a newer version is attached
+    """
+
+    def __init__(self, generation: int, version_dir: str):
+        with open(os.path.join(version_dir, "records.json"), encoding="utf-8") as f:
+            records = json.load(f)
+
+        self.generation = generation
+        self.embeddings = np.load(os.path.join(version_dir, "embeddings.npy"), mmap_mode="r")
+        self.sq_norms = np.load(os.path.join(version_dir, "sq_norms.npy"), mmap_mode="r")
+        self.ids: List[str] = records["ids"]
+        self.documents: List[str] = records["documents"]
+        self.metadatas: List[dict] = records["metadatas"]
+        self.emotions = np.array([m.get("emotion", "") for m in self.metadatas])
+        self.emotion_set = set(self.emotions.tolist())
+        self.meta: Dict = records.get("meta", {})
+
+    def rows(self) -> IndexRows:
+        return self.ids, np.asarray(self.embeddings), self.documents, self.metadatas
+
+
+class SharedIndex:
+    """
+    Embedding index built once and shared read-only between uvicorn workers
+    through memory-mapped files
+    """
+
+    def __init__(self, base_dir: str, keep_versions: int = 1):
+        self.base_dir = base_dir
+        self.keep_versions = max(1, keep_versions)
+        self._lock_path = os.path.join(base_dir, ".lock")
+        self._generation_path = os.path.join(base_dir, "generation")
+
+        os.makedirs(base_dir, exist_ok=True)
+        with self.lock():
+            if not os.path.exists(self._generation_path):
+                with open(self._generation_path, "wb") as f:
+                    f.write(b"\0" * _GENERATION_SIZE)
+
+        with open(self._generation_path, "r+b") as f:
+            self._counter = mmap.mmap(f.fileno(), _GENERATION_SIZE)
+
+        self._view: Optional[_IndexView] = None
+
+    @contextmanager
+    def lock(self, shared: bool = False):
+        """
+        Cross-process lock: exclusive around building, publishing and pruning,
+        shared while a worker maps a version so it cannot be pruned mid-attach
+        """
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @property
+    def generation(self) -> int:
+        """
+        Latest published generation (0 means nothing published yet)
+        """
+        return struct.unpack_from(_GENERATION_FORMAT, self._counter)[0]
+
+    @property
+    def loaded_generation(self) -> int:
+        """
+        Generation this process is currently serving (0 before attach)
+        """
+        view = self._view
+        return view.generation if view else 0
+
+    def _version_dir(self, generation: int) -> str:
+        return os.path.join(self.base_dir, f"v{generation}")
+
+    def versions(self) -> List[int]:
+        """
+        Generations still on disk, oldest first
+        """
+        return sorted(
+            int(name[1:]) for name in os.listdir(self.base_dir)
+            if name.startswith("v") and name[1:].isdigit()
+        )
+
+    def ensure(self, meta: Dict, builder: Callable[[IndexRows], Optional[IndexRows]]) -> bool:
+        """
+        Make sure the latest version was built from the corpus and model described
+        by meta, so a directory left over from an earlier deploy is never served
+        stale. Only the first worker to take the lock rebuilds; the others find a
+        matching version and just attach. The builder gets the current rows when
+        the embedding model is unchanged (so it can reuse embeddings), otherwise
+        empty rows. Returns True if this process published a version.
+        """
+        built = False
+        with self.lock():
+            self._attach_locked()
+            view = self._view
+            if view is None or view.meta != meta:
+                same_model = view is not None and view.meta.get("model") == meta.get("model")
+                rows = builder(view.rows() if same_model else _empty_rows())
+                if rows is None:
+                    # Same rows, only the fingerprint was missing or different
+                    rows = view.rows()
+                self._write_version(*rows, meta=meta)
+                self._attach_locked()
+                built = True
+        return built
+
+    def publish(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        documents: List[str],
+        metadatas: List[dict]
+    ) -> int:
+        """
+        Publish a new index version and announce it to all workers
+        """
+        with self.lock():
+            return self._write_version(ids, embeddings, documents, metadatas)
+
+    def update(
+        self,
+        builder: Callable[[IndexRows], Optional[IndexRows]],
+        meta: Optional[Dict] = None
+    ) -> int:
+        """
+        Derive a new version from the latest published rows while holding the lock,
+        so concurrent updaters in other workers never race. The builder returns None
+        when nothing changed. Returns the generation now live.
+        """
+        with self.lock():
+            self._attach_locked()
+            view = self._view
+            rows = builder(view.rows() if view else _empty_rows())
+            if rows is not None:
+                self._write_version(*rows, meta=meta if meta is not None else (view.meta if view else {}))
+                self._attach_locked()
+        return self.loaded_generation
+
+    def read_version(self, generation: int) -> Tuple[IndexRows, Dict]:
+        """
+        Rows and fingerprint of a retained version, e.g. to republish it as a rollback
+        """
+        with self.lock(shared=True):
+            view = _IndexView(generation, self._version_dir(generation))
+        return view.rows(), view.meta
+
+    def _write_version(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        documents: List[str],
+        metadatas: List[dict],
+        meta: Optional[Dict] = None
+    ) -> int:
+        generation = self.generation + 1
+        target = self._version_dir(generation)
+        staging = target + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        np.save(os.path.join(staging, "embeddings.npy"), matrix)
+        np.save(os.path.join(staging, "sq_norms.npy"), np.einsum("ij,ij->i", matrix, matrix))
+        with open(os.path.join(staging, "records.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "documents": documents, "metadatas": metadatas, "meta": meta or {}}, f)
+
+        # Files are complete before the directory appears and before the
+        # counter moves, so a worker never sees a half-written version
+        os.replace(staging, target)
+        struct.pack_into(_GENERATION_FORMAT, self._counter, 0, generation)
+        self._counter.flush()
+
+        self._prune(generation)
+        return generation
+
+    def _prune(self, generation: int):
+        # Workers still mapping a pruned version keep reading it safely;
+        # unlinked files live until the last mapping is closed
+        oldest_kept = generation - self.keep_versions + 1
+        for version in self.versions():
+            if version < oldest_kept:
+                shutil.rmtree(self._version_dir(version), ignore_errors=True)
+
+    def attach(self) -> bool:
+        """
+        Map the latest published version read-only
+        """
+        # Publishers prune under the exclusive lock, so the latest version
+        # cannot disappear while it is being mapped
+        with self.lock(shared=True):
+            return self._attach_locked()
+
+    def _attach_locked(self) -> bool:
+        generation = self.generation
+        if generation == 0:
+            return False
+        if generation != self.loaded_generation:
+            # One reference swap: searches holding the old view finish on it
+            self._view = _IndexView(generation, self._version_dir(generation))
+        return True
+
+    def refresh(self) -> bool:
+        """
+        Re-attach if a newer version was published. Cheap enough to call per request:
+        the lock is only taken when the generation counter has moved.
+        Returns True if a new version was loaded.
+        """
+        if self.generation == self.loaded_generation:
+            return False
+        return self.attach()
+
+    def count(self) -> int:
+        view = self._view
+        return len(view.ids) if view else 0
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        emotion: Optional[str] = None,
+        top_k: int = 3
+    ) -> List[Dict]:
+        """
+        Nearest teachings by squared L2 distance (same metric as Chroma's default)
+        """
+        view = self._view
+        if view is None or top_k <= 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        distances = view.sq_norms - 2.0 * (view.embeddings @ query) + float(query @ query)
+        return self._nearest(view, distances, emotion, top_k)
+
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        emotions: List[Optional[str]],
+        top_k: int = 3
+    ) -> List[List[Dict]]:
+        """
+        Nearest teachings for many queries from one matrix product
+        """
+        view = self._view
+        if view is None or top_k <= 0:
+            return [[] for _ in emotions]
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        distances = (
+            view.sq_norms[None, :]
+            - 2.0 * (queries @ view.embeddings.T)
+            + np.einsum("ij,ij->i", queries, queries)[:, None]
+        )
+        return [self._nearest(view, row, emotion, top_k) for row, emotion in zip(distances, emotions)]
+
+    def _nearest(
+        self,
+        view: _IndexView,
+        distances: np.ndarray,
+        emotion: Optional[str],
+        top_k: int
+    ) -> List[Dict]:
+        candidates = np.arange(len(view.ids))
+        # Labels with no rows in the corpus (e.g. peace) search unfiltered
+        if emotion and emotion != "neutral" and emotion in view.emotion_set:
+            candidates = candidates[view.emotions == emotion]
+        if candidates.size == 0:
+            return []
+
+        k = min(top_k, candidates.size)
+        subset = distances[candidates]
+        nearest = np.argpartition(subset, k - 1)[:k]
+        nearest = nearest[np.argsort(subset[nearest])]
+
+        teachings = []
+        for row in candidates[nearest]:
+            metadata = view.metadatas[row]
+            teachings.append({
+                "text": view.documents[row],
+                "source": metadata.get("source", "Unknown"),
+                "theme": metadata.get("theme", "general")
+            })
+        return teachings
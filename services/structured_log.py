@@ -0,0 +1,171 @@
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import orjson
+
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+
+
+class StructuredLogger:
+    """
+    Structured records on a bounded in-memory queue, written in batches by a
+    background thread. Logging never blocks a request: when the queue is full
+    the record is dropped and counted.
+    """
+
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+        self.flush_interval = float(os.getenv("LOG_FLUSH_SECONDS", 1.0))
+        self.batch_size = int(os.getenv("LOG_BATCH_SIZE", 500))
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._dropped_lock = threading.Lock()
+
+        self._output = logging.getLogger("osho.structured")
+        self._output.propagate = False
+        self._output.setLevel(logging.INFO)
+        log_file = os.getenv("LOG_FILE")
+        if log_file:
+            handler = logging.handlers.RotatingFileHandler(
+                log_file,
+                maxBytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+                backupCount=int(os.getenv("LOG_BACKUP_COUNT", 5)),
+                encoding="utf-8"
+            )
+        else:
+            handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._output.handlers = [handler]
+
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="structured-log-writer", daemon=True)
+        self._writer.start()
+
+    def log(self, level: str, event: str, error: Optional[BaseException] = None, **fields):
+        record = {
+            "ts": round(time.time(), 3),
+            "level": level,
+            "event": event,
+            "request_id": request_id_var.get(),
+            **fields
+        }
+        if error is not None:
+            record["error_class"] = type(error).__name__
+            record["error"] = str(error)[:500]
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Executor threads log too, and += is not atomic across threads
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def info(self, event: str, **fields):
+        self.log("info", event, **fields)
+
+    def warning(self, event: str, error: Optional[BaseException] = None, **fields):
+        self.log("warning", event, error=error, **fields)
+
+    def error(self, event: str, error: Optional[BaseException] = None, **fields):
+        self.log("error", event, error=error, **fields)
+
+    def close(self, timeout: float = 5.0):
+        """
+        Stop the writer after flushing what is queued
+        """
+        self._stop.set()
+        self._writer.join(timeout)
+
+    def _run(self):
+        while not (self._stop.is_set() and self.queue.empty()):
+            batch = self._collect()
+            if batch or self.dropped != self._reported_dropped:
+                self._write(batch)
+
+    def _collect(self) -> List[Dict]:
+        """
+        Gather records for up to one flush interval or one full batch
+        """
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Dict]):
+        lines = [orjson.dumps(record).decode() for record in _coalesce(batch)]
+
+        dropped = self.dropped
+        if dropped != self._reported_dropped:
+            lines.append(orjson.dumps({
+                "ts": round(time.time(), 3),
+                "level": "warning",
+                "event": "log.dropped",
+                "count": dropped - self._reported_dropped
+            }).decode())
+            self._reported_dropped = dropped
+
+        try:
+            self._output.info("\n".join(lines))
+        except Exception:
+            pass
+
+
+def _coalesce(batch: List[Dict]) -> List[Dict]:
+    """
+    Merge repeated identical errors in a batch into one record with a count
+    (first occurrence's position and request id, last occurrence's timestamp)
+    """
+    merged: List[Dict] = []
+    seen: Dict[tuple, Dict] = {}
+    for record in batch:
+        if "error_class" not in record:
+            merged.append(record)
+            continue
+
+        key = (record["event"], record.get("stage"), record.get("backend"), record["error_class"], record.get("error"))
+        first = seen.get(key)
+        if first is None:
+            seen[key] = record
+            merged.append(record)
+        else:
+            first["count"] = first.get("count", 1) + 1
+            first["last_ts"] = record["ts"]
+    return merged
+
+
+logger = StructuredLogger()
+
+
+class RequestContextMiddleware:
+    """
+    Plain ASGI middleware binding a request id (X-Request-ID or a new one) for log records
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        header = dict(scope["headers"]).get(b"x-request-id")
+        token = request_id_var.set(header.decode("latin-1")[:64] if header else uuid.uuid4().hex[:16])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_id_var.reset(token)
@@ -1,9 +1,41 @@
 import chromadb
 from chromadb.config import Settings
+from chromadb.utils import embedding_functions
+import hashlib
+import json
+import numpy as np
 import os
+import threading
+import time
+from collections import OrderedDict
 # Disable telemetry aggressively
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
 from typing import List, Dict, Optional
+from services.shared_index import SharedIndex, IndexRows
+from services.profiler import span
+from services.structured_log import logger
+
+DEFAULT_TEACHINGS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "teachings.json")
+
+
+def load_teachings(path: str) -> List[Dict]:
+    """
+    Load the teaching corpus (a JSON list of id/text/emotion/source/theme)
+    """
+    with open(path, encoding="utf-8") as f:
+        teachings = json.load(f)
+    
+    if not teachings:
+        raise ValueError(f"No teachings found in {path}")
+    return teachings
+
+
+def _teaching_metadata(teaching: Dict) -> Dict:
+    return {
+        "emotion": teaching["emotion"],
+        "source": teaching["source"],
+        "theme": teaching["theme"]
+    }
 
 class OshoVectorStore:
     """
@@ -11,6 +43,37 @@ class OshoVectorStore:
     """
     
     def __init__(self):
+        self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
+        self.teachings_path = os.getenv("TEACHINGS_PATH", DEFAULT_TEACHINGS_PATH)
+        self.keep_versions = int(os.getenv("INDEX_KEEP_VERSIONS", 3))
+        self.client = None
+        self.collection = None
+        self.shared_index = None
+        
+        # Local (non-shared) index versions, oldest first
+        self._version = 1
+        self._latest_version = 1
+        self._versions = OrderedDict()
+        self._rebuild_lock = threading.Lock()
+        self._emotion_cache: Dict[str, set] = {}
+        
+        # Shared mode: the first worker builds the index, every other worker
+        # maps it read-only and never creates its own Chroma client
+        shared_dir = os.getenv("SHARED_INDEX_DIR")
+        if shared_dir:
+            self.shared_index = SharedIndex(shared_dir, keep_versions=self.keep_versions)
+            teachings = load_teachings(self.teachings_path)
+            self.shared_index.ensure(
+                self._index_meta(teachings),
+                lambda current: self._diff_rows(current, teachings)
+            )
+        else:
+            self._open_collection()
+    
+    def _open_collection(self):
+        """
+        Open the Chroma collection, seeding it on first use
+        """
         persist_dir = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
         
         self.client = chromadb.Client(Settings(
@@ -20,159 +83,201 @@ class OshoVectorStore:
         
         # Get or create collection
         try:
-            self.collection = self.client.get_collection("osho_teachings")
+            self.collection = self.client.get_collection(
+                "osho_teachings",
+                embedding_function=self.embedding_function
+            )
         except:
             self.collection = self.client.create_collection(
                 name="osho_teachings",
-                metadata={"description": "Osho quotes and teachings"}
+                metadata={"description": "Osho quotes and teachings"},
+                embedding_function=self.embedding_function
             )
             self._initialize_teachings()
+        
+        self._versions[self._version] = self.collection
     
-    def _initialize_teachings(self):
+    def _index_meta(self, teachings: List[Dict]) -> Dict:
         """
-        Initialize database with core Osho teachings
+        Fingerprint of what a shared index version was built from
         """
-        teachings = [
-            # Anxiety & Worry
-            {
-                "text": "Anxiety is the gap between the now and the then. If you are in the now, there is no anxiety.",
-                "emotion": "anxiety",
-                "source": "The Book of Secrets",
-                "theme": "present_moment"
-            },
-            {
-                "text": "Worry is a futile thing. It has never helped anybody. It only destroys your today.",
-                "emotion": "anxiety",
-                "source": "Inspired by Osho",
-                "theme": "worry"
-            },
-            
-            # Sadness & Grief
-            {
-                "text": "Sadness gives depth. Happiness gives height. Sadness gives roots. Happiness gives branches.",
-                "emotion": "sadness",
-                "source": "Everyday Osho",
-                "theme": "acceptance"
-            },
-            {
-                "text": "When you are sad, be sad. Don't try to escape from it. Let it be there. Watch it.",
-                "emotion": "sadness",
-                "source": "Inspired by Osho",
-                "theme": "witnessing"
-            },
-            
-            # Confusion & Uncertainty
-            {
-                "text": "When you don't know, you are open. When you think you know, you are closed.",
-                "emotion": "confusion",
-                "source": "The Book of Understanding",
-                "theme": "not_knowing"
-            },
-            {
-                "text": "Confusion is the beginning of clarity. Stay with it.",
-                "emotion": "confusion",
-                "source": "Inspired by Osho",
-                "theme": "acceptance"
-            },
-            
-            # Loneliness
-            {
-                "text": "Loneliness is the absence of the other. Aloneness is the presence of oneself.",
-                "emotion": "loneliness",
-                "source": "The Path of Meditation",
-                "theme": "aloneness"
-            },
-            {
-                "text": "You are born alone, you will die alone. And in between, you are alone. Accept it.",
-                "emotion": "loneliness",
-                "source": "Inspired by Osho",
-                "theme": "acceptance"
-            },
-            
-            # Anger
-            {
-                "text": "Anger is beautiful. Watch it. Don't act on it, don't suppress it. Just watch.",
-                "emotion": "anger",
-                "source": "Tantra: The Supreme Understanding",
-                "theme": "witnessing"
-            },
-            {
-                "text": "When anger comes, close your eyes and watch where it is in the body. Watch it like a scientist.",
-                "emotion": "anger",
-                "source": "Inspired by Osho",
-                "theme": "awareness"
-            },
+        corpus = json.dumps(teachings, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return {
+            "corpus": hashlib.sha256(corpus).hexdigest(),
+            "model": getattr(self.embedding_function, "MODEL_NAME", type(self.embedding_function).__name__)
+        }
+    
+    @property
+    def version(self) -> int:
+        """
+        Index version currently serving searches; retrieval caches key on this.
+        In shared mode this first picks up any newly published generation, so it
+        is the version the next search will use.
+        """
+        if self.shared_index:
+            self.shared_index.refresh()
+            return self.shared_index.loaded_generation
+        return self._version
+    
+    def versions(self) -> List[int]:
+        """
+        Versions retained for rollback, oldest first
+        """
+        if self.shared_index:
+            return self.shared_index.versions()
+        return list(self._versions)
+    
+    def rebuild(self, teachings: List[Dict]) -> int:
+        """
+        Build a new index version from the given corpus and swap it in atomically.
+        Only new or edited passages are embedded. Returns the version now live.
+        """
+        with self._rebuild_lock:
+            if self.shared_index:
+                return self.shared_index.update(
+                    lambda current: self._diff_rows(current, teachings),
+                    meta=self._index_meta(teachings)
+                )
             
-            # Meaninglessness
-            {
-                "text": "Life has no meaning. And that is its beauty. You are free to create your own meaning.",
-                "emotion": "meaninglessness",
-                "source": "The Book of Understanding",
-                "theme": "freedom"
-            },
+            collection = self.collection
+            rows = collection.get(include=["embeddings", "documents", "metadatas"])
+            new_rows = self._diff_rows(
+                (rows["ids"], np.asarray(rows["embeddings"]), rows["documents"], rows["metadatas"]),
+                teachings
+            )
+            if new_rows is None:
+                return self._version
             
-            # Overthinking
-            {
-                "text": "The mind is a beautiful servant but a dangerous master.",
-                "emotion": "overthinking",
-                "source": "Inspired by Osho",
-                "theme": "mind"
-            },
-            {
-                "text": "Thoughts are like clouds. Watch them come and go. You are the sky.",
-                "emotion": "overthinking",
-                "source": "Meditation: The First and Last Freedom",
-                "theme": "witnessing"
-            },
+            ids, embeddings, documents, metadatas = new_rows
+            version = self._latest_version + 1
+            collection = self.client.create_collection(
+                name=f"osho_teachings_v{version}",
+                metadata={"description": "Osho quotes and teachings"},
+                embedding_function=self.embedding_function
+            )
+            collection.add(
+                ids=ids,
+                embeddings=embeddings.tolist(),
+                documents=documents,
+                metadatas=metadatas
+            )
+            self._activate(version, collection)
+            return version
+    
+    def rollback(self, version: int) -> int:
+        """
+        Make a retained version live again. Returns the version now live.
+        """
+        with self._rebuild_lock:
+            if self.shared_index:
+                # Workers follow the generation counter, so republish the old rows
+                if version not in self.shared_index.versions():
+                    raise KeyError(f"Index version {version} is not retained")
+                old_rows, old_meta = self.shared_index.read_version(version)
+                return self.shared_index.update(lambda current: old_rows, meta=old_meta)
             
-            # General Awareness
-            {
-                "text": "Be — don't try to become.",
-                "emotion": "neutral",
-                "source": "The Book of Secrets",
-                "theme": "being"
-            },
-            {
-                "text": "Awareness is the greatest alchemy there is. Just go on becoming more and more aware.",
-                "emotion": "neutral",
-                "source": "The Path of Meditation",
-                "theme": "awareness"
-            },
-            {
-                "text": "The moment you become aware of a feeling, it starts changing.",
-                "emotion": "neutral",
-                "source": "Inspired by Osho",
-                "theme": "transformation"
-            }
-        ]
+            if version not in self._versions:
+                raise KeyError(f"Index version {version} is not retained")
+            self.collection = self._versions[version]
+            self._version = version
+            return version
+    
+    def _activate(self, version: int, collection):
+        # A single reference swap: searches that already read self.collection
+        # finish on the old version, new searches see this one
+        self.collection = collection
+        self._version = version
+        self._latest_version = version
+        self._versions[version] = collection
+        
+        for old_version in list(self._versions)[:-self.keep_versions]:
+            old = self._versions.pop(old_version)
+            self._emotion_cache.pop(old.name, None)
+            self.client.delete_collection(old.name)
+    
+    def _diff_rows(self, current: IndexRows, teachings: List[Dict]) -> Optional[IndexRows]:
+        """
+        Rows for the new corpus, reusing embeddings of unchanged passages.
+        Returns None when the corpus is identical to the current one.
+        """
+        current_ids, current_embeddings, current_documents, current_metadatas = current
+        
+        ids = [teaching["id"] for teaching in teachings]
+        documents = [teaching["text"] for teaching in teachings]
+        metadatas = [_teaching_metadata(teaching) for teaching in teachings]
+        if ids == list(current_ids) and documents == list(current_documents) and metadatas == list(current_metadatas):
+            return None
+        
+        existing = {
+            (teaching_id, document): row
+            for row, (teaching_id, document) in enumerate(zip(current_ids, current_documents))
+        }
+        changed = [i for i, key in enumerate(zip(ids, documents)) if key not in existing]
+        fresh = self.embed([documents[i] for i in changed]) if changed else None
+        
+        dimension = fresh.shape[1] if fresh is not None else current_embeddings.shape[1]
+        embeddings = np.empty((len(ids), dimension), dtype=np.float32)
+        for i, key in enumerate(zip(ids, documents)):
+            if key in existing:
+                embeddings[i] = current_embeddings[existing[key]]
+        if fresh is not None:
+            embeddings[changed] = fresh
+        
+        return ids, embeddings, documents, metadatas
+    
+    def _initialize_teachings(self):
+        """
+        Initialize database with core Osho teachings
+        """
+        teachings = load_teachings(self.teachings_path)
         
         # Add teachings to vector store
-        for i, teaching in enumerate(teachings):
-            self.collection.add(
-                documents=[teaching["text"]],
-                metadatas=[{
-                    "emotion": teaching["emotion"],
-                    "source": teaching["source"],
-                    "theme": teaching["theme"]
-                }],
-                ids=[f"teaching_{i}"]
-            )
+        self.collection.add(
+            documents=[teaching["text"] for teaching in teachings],
+            metadatas=[_teaching_metadata(teaching) for teaching in teachings],
+            ids=[teaching["id"] for teaching in teachings]
+        )
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts with the same model the index was built with
+        """
+        with span("vector.embed", count=len(texts)):
+            return np.asarray(self.embedding_function(texts), dtype=np.float32)
     
-    def search(self, query: str, emotion: Optional[str] = None, top_k: int = 3) -> List[Dict]:
+    def search(
+        self,
+        query: str,
+        emotion: Optional[str] = None,
+        top_k: int = 3,
+        query_embedding: Optional[np.ndarray] = None
+    ) -> List[Dict]:
         """
         Search for relevant teachings based on query and emotion
+        Pass query_embedding to reuse an embedding computed earlier in the request
         """
+        started = time.perf_counter()
         try:
-            # Build where filter for emotion
+            if query_embedding is None:
+                query_embedding = self.embed([query])[0]
+            
+            if self.shared_index:
+                with span("vector.search", backend="shared", top_k=top_k):
+                    self.shared_index.refresh()
+                    return self.shared_index.search(query_embedding, emotion, top_k)
+            
+            # Build where filter for emotion (only for emotions the corpus has rows for)
+            collection = self.collection
             where_filter = None
-            if emotion and emotion != "neutral":
+            if emotion and emotion != "neutral" and emotion in self._indexed_emotions(collection):
                 where_filter = {"emotion": emotion}
             
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=top_k,
-                where=where_filter
-            )
+            with span("vector.search", backend="chroma", top_k=top_k):
+                results = collection.query(
+                    query_embeddings=[query_embedding.tolist()],
+                    n_results=top_k,
+                    where=where_filter
+                )
             
             # Format results
             teachings = []
@@ -187,14 +292,88 @@ class OshoVectorStore:
             return teachings
             
         except Exception as e:
-            print(f"Vector search error: {e}")
+            logger.error(
+                "vector.search", error=e, stage="search",
+                backend="shared" if self.shared_index else "chroma",
+                latency_ms=round((time.perf_counter() - started) * 1000, 1)
+            )
             return []
     
+    def search_batch(
+        self,
+        queries: List[str],
+        emotions: List[Optional[str]],
+        top_k: int = 3,
+        query_embeddings: Optional[np.ndarray] = None
+    ) -> List[List[Dict]]:
+        """
+        Search for many queries at once, one Chroma call per distinct emotion
+        """
+        started = time.perf_counter()
+        try:
+            if query_embeddings is None:
+                query_embeddings = self.embed(queries)
+            
+            if self.shared_index:
+                with span("vector.search_batch", backend="shared", count=len(queries)):
+                    self.shared_index.refresh()
+                    return self.shared_index.search_batch(query_embeddings, emotions, top_k)
+            
+            # Chroma takes a single where filter per query call, so group by emotion
+            collection = self.collection
+            indexed = self._indexed_emotions(collection)
+            groups: Dict[Optional[str], List[int]] = {}
+            for i, emotion in enumerate(emotions):
+                key = emotion if emotion and emotion != "neutral" and emotion in indexed else None
+                groups.setdefault(key, []).append(i)
+            
+            batch_results: List[List[Dict]] = [[] for _ in queries]
+            for emotion, rows in groups.items():
+                with span("vector.search_batch", backend="chroma", count=len(rows)):
+                    results = collection.query(
+                        query_embeddings=[query_embeddings[i].tolist() for i in rows],
+                        n_results=top_k,
+                        where={"emotion": emotion} if emotion else None
+                    )
+                for j, i in enumerate(rows):
+                    batch_results[i] = [
+                        {
+                            "text": document,
+                            "source": metadata.get("source", "Unknown"),
+                            "theme": metadata.get("theme", "general")
+                        }
+                        for document, metadata in zip(results["documents"][j], results["metadatas"][j])
+                    ]
+            
+            return batch_results
+            
+        except Exception as e:
+            logger.error(
+                "vector.search_batch", error=e, stage="search",
+                backend="shared" if self.shared_index else "chroma",
+                latency_ms=round((time.perf_counter() - started) * 1000, 1)
+            )
+            return [[] for _ in queries]
+    
+    def _indexed_emotions(self, collection) -> set:
+        """
+        Emotions that have at least one teaching in this collection, cached per
+        collection (each index version is its own collection)
+        """
+        emotions = self._emotion_cache.get(collection.name)
+        if emotions is None:
+            metadatas = collection.get(include=["metadatas"])["metadatas"]
+            emotions = {metadata.get("emotion") for metadata in metadatas}
+            self._emotion_cache[collection.name] = emotions
+        return emotions
+    
     def is_ready(self) -> bool:
         """
         Check if vector store is ready
         """
         try:
+            if self.shared_index:
+                return self.shared_index.count() > 0
             return self.collection.count() > 0
         except:
             return False
@@ -0,0 +1,111 @@
+"""
+Tests for the ASGI compression middleware
+"""
+import asyncio
+import gzip
+
+from services.compression import CompressionMiddleware, choose_encoding
+
+
+def run(chunks, content_type=b"application/json", accept=b"gzip", minimum_size=100):
+    """
+    Send chunks through the middleware; returns the start message, the body
+    messages, and how many messages the client had received after each chunk
+    """
+    sent = []
+    received_after = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type)]})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+            received_after.append(len(sent))
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept)]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=minimum_size)(scope, None, send))
+    return sent[0], sent[1:], received_after
+
+
+def body_of(start, messages) -> bytes:
+    body = b"".join(message["body"] for message in messages)
+    if (b"content-encoding", b"gzip") in start["headers"]:
+        return gzip.decompress(body)
+    return body
+
+
+def test_choose_encoding_respects_refusals():
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("identity") is None
+
+
+def test_small_whole_body_is_not_compressed():
+    start, messages, _ = run([b"{}"])
+
+    assert (b"content-encoding", b"gzip") not in start["headers"]
+    assert body_of(start, messages) == b"{}"
+
+
+def test_small_sse_events_are_delivered_as_they_are_sent():
+    chunks = [b"data: event %d\n\n" % i for i in range(5)]
+    start, messages, received_after = run(chunks, content_type=b"text/event-stream")
+
+    # Headers and every event reach the client immediately, not at end of stream
+    assert received_after == [2, 3, 4, 5, 6]
+    assert (b"content-encoding", b"gzip") in start["headers"]
+    assert body_of(start, messages) == b"".join(chunks)
+
+
+def test_small_whole_stream_body_is_not_compressed():
+    start, messages, _ = run([b"data: done\n\n"], content_type=b"text/event-stream")
+
+    assert (b"content-encoding", b"gzip") not in start["headers"]
+    assert messages[0]["body"] == b"data: done\n\n"
+
+
+def test_small_chunked_json_body_is_not_compressed():
+    chunks = [b'{"a": 1,', b' "b": 2', b"}"]
+    start, messages, _ = run(chunks)
+
+    assert (b"content-encoding", b"gzip") not in start["headers"]
+    assert len(messages) == 1 and not messages[0]["more_body"]
+    assert messages[0]["body"] == b"".join(chunks)
+
+
+def test_chunked_json_body_is_compressed_once_past_threshold():
+    chunks = [b'{"text": "', b"a" * 60, b"b" * 60, b'"}']
+    start, messages, received_after = run(chunks)
+
+    assert (b"content-encoding", b"gzip") in start["headers"]
+    assert received_after[:2] == [0, 0]
+    assert body_of(start, messages) == b"".join(chunks)
+
+
+def test_large_whole_body_is_compressed_with_content_length():
+    body = b'{"text": "' + b"a" * 1000 + b'"}'
+    start, messages, _ = run([body])
+
+    assert (b"content-encoding", b"gzip") in start["headers"]
+    assert (b"content-length", str(len(messages[0]["body"])).encode()) in start["headers"]
+    assert body_of(start, messages) == body
+
+
+def test_streamed_body_is_compressed_once_past_threshold():
+    chunks = [b'{"chunk": %d, "text": "%s"}\n' % (i, b"x" * 40) for i in range(10)]
+    start, messages, _ = run(chunks, content_type=b"application/x-ndjson")
+
+    assert (b"content-encoding", b"gzip") in start["headers"]
+    assert all(name != b"content-length" for name, _ in start["headers"])
+    assert messages[0]["more_body"] and not messages[-1]["more_body"]
+    assert body_of(start, messages) == b"".join(chunks)
+
+
+def test_non_compressible_type_passes_through():
+    body = b"\x89PNG" + b"\x00" * 1000
+    start, messages, _ = run([body], content_type=b"image/png")
+
+    assert (b"content-encoding", b"gzip") not in start["headers"]
+    assert body_of(start, messages) == body
@@ -0,0 +1,124 @@
+"""
+Tests for the corpus file watcher and reload retries
+"""
+import asyncio
+import json
+import os
+
+import pytest
+
+pytest.importorskip("orjson")
+
+from services.corpus_reloader import CorpusReloader
+
+
+class RecordingStore:
+    """
+    Stands in for OshoVectorStore: counts rebuilds and rollbacks
+    """
+
+    def __init__(self, path, shared=False):
+        self.teachings_path = str(path)
+        self.shared_index = object() if shared else None
+        self.version = 1
+        self.rebuilt = []
+
+    def rebuild(self, teachings):
+        self.rebuilt.append(teachings)
+        self.version += 1
+        return self.version
+
+    def rollback(self, version):
+        if version >= self.version:
+            raise KeyError(f"Index version {version} is not retained")
+        self.version = version
+        return version
+
+
+def write(path, content, mtime):
+    path.write_text(content, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+CORPUS = json.dumps([{"id": "teaching_0", "text": "Be here.", "emotion": "peace", "source": "Osho", "theme": "now"}])
+
+
+def test_scope_follows_shared_mode(tmp_path):
+    path = tmp_path / "teachings.json"
+    write(path, CORPUS, 1000)
+
+    assert CorpusReloader(RecordingStore(path)).scope == "worker"
+    assert CorpusReloader(RecordingStore(path, shared=True)).scope == "all_workers"
+
+
+def test_failed_reload_leaves_the_mtime_to_retry(tmp_path):
+    path = tmp_path / "teachings.json"
+    write(path, CORPUS, 1000)
+    store = RecordingStore(path)
+    reloader = CorpusReloader(store)
+
+    # Caught half-written: the parse fails and the new mtime is not marked handled
+    write(path, '[{"id": "teach', 2000)
+    with pytest.raises(ValueError):
+        asyncio.run(reloader.reload())
+    assert reloader._mtime == 1000
+    assert store.rebuilt == []
+
+    write(path, CORPUS, 2000)
+    assert asyncio.run(reloader.reload()) == 2
+    assert reloader._mtime == 2000
+
+
+def test_watcher_retries_until_the_corpus_parses(tmp_path, monkeypatch):
+    monkeypatch.setenv("TEACHINGS_WATCH_INTERVAL", "0.01")
+    path = tmp_path / "teachings.json"
+    write(path, CORPUS, 1000)
+    store = RecordingStore(path)
+
+    async def scenario():
+        reloader = CorpusReloader(store)
+        reloader.start()
+        write(path, "not json", 2000)
+        await asyncio.sleep(0.1)
+        broken_version = store.version
+
+        write(path, CORPUS, 2000)
+        for _ in range(100):
+            if store.version > broken_version:
+                break
+            await asyncio.sleep(0.01)
+
+        await reloader.stop()
+        return reloader, broken_version
+
+    reloader, broken_version = asyncio.run(scenario())
+
+    assert broken_version == 1
+    assert store.version == 2
+    assert len(store.rebuilt) == 1
+    assert reloader._task is None
+
+
+def test_watcher_is_disabled_at_zero_interval(tmp_path, monkeypatch):
+    monkeypatch.setenv("TEACHINGS_WATCH_INTERVAL", "0")
+    path = tmp_path / "teachings.json"
+    write(path, CORPUS, 1000)
+
+    async def scenario():
+        reloader = CorpusReloader(RecordingStore(path))
+        reloader.start()
+        return reloader._task
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_rollback_runs_through_the_store(tmp_path):
+    path = tmp_path / "teachings.json"
+    write(path, CORPUS, 1000)
+    store = RecordingStore(path)
+    reloader = CorpusReloader(store)
+    asyncio.run(reloader.reload())
+
+    assert asyncio.run(reloader.rollback(1)) == 1
+    with pytest.raises(KeyError):
+        asyncio.run(reloader.rollback(5))
@@ -0,0 +1,85 @@
+"""
+Tests for the embedding emotion classifier and its keyword fallback
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from services.emotion_classifier import EmbeddingEmotionClassifier
+from services.emotion_detector import EmotionDetector
+
+
+def one_hot_embed(detector):
+    """
+    Fake embedder: every keyword of emotion k maps to axis k, anything else to the last axis
+    """
+    labels = list(detector.emotion_keywords)
+    axis = {phrase: i for i, label in enumerate(labels) for phrase in detector.emotion_keywords[label]}
+    dim = len(labels) + 1
+
+    def embed(texts):
+        return np.stack([np.eye(dim, dtype=np.float32)[axis.get(text, dim - 1)] for text in texts])
+
+    return embed, labels, dim
+
+
+def make_classifier():
+    detector = EmotionDetector()
+    embed, labels, dim = one_hot_embed(detector)
+    return EmbeddingEmotionClassifier(embed, detector), labels, dim
+
+
+def test_confident_embedding_wins():
+    classifier, labels, dim = make_classifier()
+    vector = np.eye(dim, dtype=np.float32)[labels.index("anxiety")]
+
+    result = classifier.classify("something unrelated", vector)
+    assert result["emotion"] == "anxiety"
+    assert result["method"] == "embedding"
+    assert result["labels"] == ["anxiety"]
+
+
+def test_far_from_every_prototype_abstains_to_neutral():
+    classifier, labels, dim = make_classifier()
+    vector = np.eye(dim, dtype=np.float32)[dim - 1]
+
+    result = classifier.classify("the weather report for tuesday", vector)
+    assert result["emotion"] == "neutral"
+    assert result["method"] == "keyword"
+
+
+def test_ambiguous_embedding_falls_back_to_keywords():
+    classifier, labels, dim = make_classifier()
+    eye = np.eye(dim, dtype=np.float32)
+    vector = eye[labels.index("anger")] + eye[labels.index("sadness")]
+
+    result = classifier.classify("I am so sad today", vector)
+    assert result["emotion"] == "sadness"
+    assert result["method"] == "keyword"
+
+
+def test_batch_matches_single_and_keyword_result_shape():
+    classifier, labels, dim = make_classifier()
+    eye = np.eye(dim, dtype=np.float32)
+    texts = ["a", "b"]
+    vectors = np.stack([eye[labels.index("peace")], eye[dim - 1]])
+
+    batch = classifier.classify_batch(texts, vectors)
+    assert batch == [classifier.classify(t, v) for t, v in zip(texts, vectors)]
+    assert classifier.keyword_result("I feel lonely")["emotion"] == "loneliness"
+
+
+def test_keyword_fallback_reports_the_returned_labels_confidence():
+    classifier, labels, dim = make_classifier()
+    eye = np.eye(dim, dtype=np.float32)
+    # Anger narrowly leads on the embedding, too narrowly to be trusted
+    vector = eye[labels.index("anger")] + 0.997 * eye[labels.index("sadness")]
+
+    result = classifier.classify("I am so sad today", vector)
+    assert result["method"] == "keyword"
+    assert result["emotion"] == "sadness"
+    assert result["scores"]["anger"] > result["scores"]["sadness"]
+    assert result["confidence"] == result["scores"]["sadness"]
+
+    neutral = classifier.classify("the weather report for tuesday", eye[dim - 1])
+    assert neutral["emotion"] == "neutral" and neutral["confidence"] == 0.0
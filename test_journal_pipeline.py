@@ -0,0 +1,139 @@
+"""
+Tests for long journal entry chunking and the map-reduce pipeline
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("orjson")
+
+from services.journal_pipeline import JournalPipeline, iter_chunks
+from services.prompt_builder import PromptBuilder, estimate_tokens
+
+
+def test_short_text_is_one_chunk():
+    assert list(iter_chunks("I feel calm. The day was long.", 800)) == ["I feel calm. The day was long."]
+
+
+def test_chunks_break_on_sentences_and_respect_max_chars():
+    text = " ".join(f"Sentence number {i} is here." for i in range(40))
+    chunks = list(iter_chunks(text, 120))
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 120 for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert " ".join(chunks) == text
+
+
+def test_overlong_sentence_is_split_on_whitespace():
+    sentence = " ".join(["word"] * 100)
+    chunks = list(iter_chunks(f"Short one. {sentence}", 50))
+
+    assert chunks[0] == "Short one."
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert " ".join(chunks[1:]) == sentence
+
+
+def test_paragraph_breaks_and_danda_end_sentences():
+    chunks = list(iter_chunks("मैं दुखी हूँ। आज कठिन था।\n\nNext paragraph", 20))
+    assert chunks == ["मैं दुखी हूँ।", "आज कठिन था।", "Next paragraph"]
+
+
+class FailingGroq:
+    """
+    Fails every chunk summary, as an upstream outage would
+    """
+
+    def __init__(self):
+        self.prompts = []
+
+    async def generate(self, system_prompt, user_prompt, conversation_history=None, max_tokens=500, fallback=True):
+        self.prompts.append(user_prompt)
+        if not fallback:
+            raise TimeoutError("upstream timed out")
+        return "fallback reply"
+
+
+def test_failed_summaries_use_the_chunk_text_not_the_fallback_reply():
+    groq = FailingGroq()
+    pipeline = JournalPipeline(None, None, groq, PromptBuilder())
+    chunks = ["short chunk", "x " * 400]
+
+    summaries = asyncio.run(pipeline._summarize(chunks))
+
+    assert summaries[0] == "short chunk"
+    assert summaries[1].endswith("…")
+    assert len(summaries[1]) <= pipeline.summary_fallback_chars + 1
+    assert "fallback reply" not in summaries
+
+
+def test_dominant_emotion_counts_chunks_before_confidence():
+    pipeline = JournalPipeline(None, None, None, PromptBuilder())
+
+    def result(emotion, confidence):
+        return {"emotion": emotion, "confidence": confidence}
+
+    keyword_only = [result("anger", 0.0), result("sadness", 0.0), result("sadness", 0.0)]
+    assert pipeline._dominant_emotion(keyword_only) == "sadness"
+
+    one_confident = [result("peace", 0.4)] + [result("sadness", 0.0)] * 5
+    assert pipeline._dominant_emotion(one_confident) == "sadness"
+
+    tied = [result("anger", 0.2), result("sadness", 0.6), result("neutral", 0.9)]
+    assert pipeline._dominant_emotion(tied) == "sadness"
+    assert pipeline._dominant_emotion([result("neutral", 0.9)]) == "neutral"
+
+
+def test_chunk_count_is_capped_by_growing_chunks(monkeypatch):
+    monkeypatch.setenv("JOURNAL_MAX_CHUNKS", "8")
+    pipeline = JournalPipeline(None, None, None, PromptBuilder())
+    text = " ".join(f"Sentence number {i} is about my day." for i in range(5000))
+
+    chunks = pipeline._chunk(text)
+    assert len(chunks) <= 8
+    assert " ".join(chunks) == text
+
+
+class StubVectorStore:
+    def embed(self, texts):
+        return [[0.0] for _ in texts]
+
+    def search_batch(self, queries, emotions, top_k=3, query_embeddings=None):
+        return [[{"text": "Be a witness.", "source": "Osho"}] for _ in queries]
+
+
+class StubClassifier:
+    def classify_batch(self, texts, embeddings):
+        return [{"emotion": "sadness", "confidence": 0.0} for _ in texts]
+
+
+class WordyGroq:
+    """
+    Every summary is long, so the section overview overflows the journal budget
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    async def generate(self, system_prompt, user_prompt, conversation_history=None, max_tokens=500, fallback=True):
+        self.calls.append((system_prompt, user_prompt))
+        return "a long and winding summary " * 20
+
+
+def test_reduce_prompt_is_condensed_to_fit_the_journal_budget(monkeypatch):
+    monkeypatch.setenv("JOURNAL_MAX_CHUNKS", "16")
+    groq = WordyGroq()
+    builder = PromptBuilder()
+    pipeline = JournalPipeline(StubVectorStore(), StubClassifier(), groq, builder)
+    text = " ".join(f"Sentence number {i} is about my day." for i in range(3000))
+
+    result = asyncio.run(pipeline.reflect(text))
+
+    final_system, final_user = groq.calls[-1]
+    budget = builder.get_template("journal").token_budget
+    assert final_system == builder.build_journal_prompt()
+    assert "Sections 1-" in final_user
+    assert estimate_tokens(final_system) + estimate_tokens(final_user) <= budget
+    assert len(result["emotion_trajectory"]) == 16
+    # 16 chunk summaries, one round of 8 pair merges, then the final reflection
+    assert len(groq.calls) == 16 + 8 + 1
@@ -0,0 +1,64 @@
+"""
+Tests for the draft-message prefetch cache
+"""
+from services.prefetch_cache import PrefetchCache
+
+
+def make_cache(monkeypatch, **env):
+    for name, value in env.items():
+        monkeypatch.setenv(name, str(value))
+    return PrefetchCache()
+
+
+def test_take_returns_result_for_same_draft(monkeypatch):
+    cache = make_cache(monkeypatch)
+    cache.put("k", "I feel  anxious", 1, {"emotion": "anxiety"}, 12.5)
+
+    assert cache.take("k", "i feel anxious", 1) == {"emotion": "anxiety"}
+    assert cache.take("k", "i feel anxious", 1) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["latency_saved_ms"] == 12.5
+
+
+def test_take_accepts_small_edits_and_rejects_different_messages(monkeypatch):
+    cache = make_cache(monkeypatch, PREFETCH_MIN_SIMILARITY=0.9)
+    cache.put("a", "I cannot stop overthinking about work", 1, {"n": 1}, 5)
+    cache.put("b", "I cannot stop overthinking about work", 1, {"n": 2}, 5)
+
+    assert cache.take("a", "I cannot stop overthinking about work!", 1) == {"n": 1}
+    assert cache.take("b", "Tell me about meditation", 1) is None
+
+
+def test_entries_from_another_index_version_are_stale(monkeypatch):
+    cache = make_cache(monkeypatch)
+    cache.put("k", "hello", 1, {"n": 1}, 5)
+
+    assert cache.take("k", "hello", 2) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache = make_cache(monkeypatch, PREFETCH_TTL_SECONDS=0)
+    cache.put("k", "hello", 1, {"n": 1}, 5)
+
+    assert cache.get("k", "hello", 1) is None
+    assert cache.take("k", "hello", 1) is None
+
+
+def test_get_is_exact_and_does_not_count(monkeypatch):
+    cache = make_cache(monkeypatch)
+    cache.put("k", "hello there", 1, {"n": 1}, 5)
+
+    assert cache.get("k", "Hello  there", 1)["result"] == {"n": 1}
+    assert cache.get("k", "hello there!", 1) is None
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 0
+
+
+def test_oldest_entries_are_evicted(monkeypatch):
+    cache = make_cache(monkeypatch, PREFETCH_MAX_ENTRIES=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key, 1, {"key": key}, 1)
+
+    assert cache.stats()["entries"] == 2
+    assert cache.get("a", "a", 1) is None
+    assert cache.get("c", "c", 1)["result"] == {"key": "c"}
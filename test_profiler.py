@@ -0,0 +1,152 @@
+"""
+Tests for per-request profiling spans, gating and trace export
+"""
+import asyncio
+import json
+import os
+
+import pytest
+
+pytest.importorskip("orjson")
+
+from services import profiler as profiler_module
+from services.profiler import Profiler, ProfilingMiddleware, Trace, _current_trace, run_in_executor, span
+
+
+def traced(coroutine_factory):
+    """
+    Run a coroutine with a fresh trace bound, the way ProfilingMiddleware does
+    """
+    trace = Trace("test")
+
+    async def main():
+        token = _current_trace.set(trace)
+        try:
+            with span("request"):
+                await coroutine_factory()
+        finally:
+            _current_trace.reset(token)
+
+    asyncio.run(main())
+    return {event["name"]: event for event in trace.events}, trace
+
+
+def test_spans_nest_with_parent_ids():
+    async def handler():
+        with span("outer", stage="a") as outer:
+            with span("inner"):
+                pass
+            outer.set(rows=3)
+
+    events, _ = traced(handler)
+
+    request, outer, inner = events["request"], events["outer"], events["inner"]
+    assert request["args"]["parent_id"] == 0
+    assert outer["args"]["parent_id"] == request["args"]["span_id"]
+    assert inner["args"]["parent_id"] == outer["args"]["span_id"]
+    assert outer["args"]["stage"] == "a" and outer["args"]["rows"] == 3
+    assert outer["ts"] <= inner["ts"] and inner["dur"] <= outer["dur"]
+
+
+def test_executor_work_records_queue_time_and_nested_spans():
+    async def handler():
+        with span("retrieve"):
+            def work():
+                with span("vector.search"):
+                    return 42
+            assert await run_in_executor(work, "retrieve.thread") == 42
+
+    events, _ = traced(handler)
+
+    retrieve = events["retrieve"]["args"]["span_id"]
+    assert events["executor.queue"]["args"]["parent_id"] == retrieve
+    assert events["retrieve.thread"]["args"]["parent_id"] == retrieve
+    assert events["vector.search"]["args"]["parent_id"] == events["retrieve.thread"]["args"]["span_id"]
+
+
+def test_failed_span_records_the_error_class():
+    async def handler():
+        with pytest.raises(ValueError):
+            with span("boom"):
+                raise ValueError("bad")
+
+    events, _ = traced(handler)
+    assert events["boom"]["args"]["error"] == "ValueError"
+
+
+def test_spans_are_a_shared_no_op_without_a_trace():
+    assert span("a") is span("b")
+    with span("a") as stage:
+        stage.set(rows=1)
+    assert asyncio.run(run_in_executor(lambda: 7, "work")) == 7
+
+
+def test_to_chrome_is_trace_event_json():
+    _, trace = traced(lambda: asyncio.sleep(0))
+    exported = json.loads(json.dumps(trace.to_chrome()))
+
+    assert exported["displayTimeUnit"] == "ms"
+    assert exported["otherData"]["trace_id"] == trace.trace_id
+    assert exported["otherData"]["request"] == "test"
+    assert {event["ph"] for event in exported["traceEvents"]} == {"X"}
+
+
+def test_x_profile_needs_a_valid_admin_token(monkeypatch):
+    monkeypatch.setenv("PROFILE_SAMPLE_RATE", "0")
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    profiler = Profiler()
+
+    assert profiler.should_trace(b"1", b"secret")
+    assert not profiler.should_trace(b"0", b"secret")
+    assert not profiler.should_trace(b"1", None)
+    assert not profiler.should_trace(b"1", b"wrong")
+
+    monkeypatch.delenv("ADMIN_TOKEN")
+    assert not profiler.should_trace(b"1", b"secret")
+
+
+def run_request(headers):
+    async def app(scope, receive, send):
+        with span("handler"):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"{}"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/health", "headers": headers}
+    asyncio.run(ProfilingMiddleware(app)(scope, None, send))
+    return dict(sent[0]["headers"])
+
+
+def test_middleware_traces_only_admin_requests(monkeypatch):
+    monkeypatch.setenv("PROFILE_SAMPLE_RATE", "0")
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    profiler = Profiler()
+    monkeypatch.setattr(profiler_module, "profiler", profiler)
+
+    assert b"x-trace-id" not in run_request([(b"x-profile", b"1")])
+    trace_id = run_request([(b"x-profile", b"1"), (b"x-admin-token", b"secret")])[b"x-trace-id"]
+
+    trace = profiler.get(trace_id.decode())
+    assert trace.name == "GET /health"
+    assert [summary["trace_id"] for summary in profiler.summaries()] == [trace.trace_id]
+    assert {event["name"] for event in trace.events} == {"request", "handler"}
+
+
+def test_exported_trace_files_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILE_MAX_FILES", "3")
+    profiler = Profiler()
+
+    traces = [Trace(f"request {i}") for i in range(5)]
+    for i, trace in enumerate(traces):
+        profiler.finish(trace)
+        # Distinct mtimes so the oldest files are the ones pruned
+        profiler._writer.submit(os.utime, tmp_path / f"trace_{trace.trace_id}.json", (i, i))
+    profiler.close()
+
+    assert len(profiler.recent) == 5
+    assert sorted(os.listdir(tmp_path)) == sorted(f"trace_{trace.trace_id}.json" for trace in traces[2:])
@@ -0,0 +1,92 @@
+"""
+Tests for compiled prompt templates and token budget trimming
+"""
+from services.prompt_builder import MASTER_SYSTEM_PROMPT, PromptBuilder, PromptTemplate, estimate_tokens
+
+TEACHINGS = [
+    {"text": "Be a witness to your thoughts.", "source": "Osho"},
+    {"text": "Life is not a problem to be solved.", "source": "Osho"},
+    {"text": "Meditation is just to be.", "source": "Osho"},
+]
+
+
+def legacy_user_prompt(message, emotion, teachings, language="en"):
+    # The format build_user_prompt produced before templates were compiled
+    prompt_parts = [
+        f"User's message: {message}",
+        f"\nDetected emotion: {emotion or 'neutral'}",
+    ]
+    if teachings:
+        prompt_parts.append("\nRelevant Osho teachings:")
+        for i, teaching in enumerate(teachings[:2], 1):
+            prompt_parts.append(f"\n{i}. \"{teaching['text']}\"")
+            prompt_parts.append(f"   Source: {teaching['source']}")
+    if language == "hi":
+        prompt_parts.append("\nRespond in simple Hindi (Devanagari script).")
+    else:
+        prompt_parts.append("\nRespond in simple English.")
+    prompt_parts.append("\nProvide a gentle, awareness-based response following the MCP process.")
+    return "\n".join(prompt_parts)
+
+
+def test_user_prompt_matches_legacy_format():
+    builder = PromptBuilder()
+    for language in ("en", "hi"):
+        for teachings in (TEACHINGS, TEACHINGS[:1], []):
+            for emotion in ("anxiety", None):
+                expected = legacy_user_prompt("I feel lost", emotion, teachings, language)
+                assert builder.build_user_prompt("I feel lost", emotion, teachings, language) == expected
+
+
+def test_system_prompt_is_identical_across_requests():
+    builder = PromptBuilder()
+    first = builder.render("chat", "hello", "peace", TEACHINGS).system
+    second = builder.render("chat", "something else entirely", None, [], "hi").system
+
+    assert first == second == builder.build_system_prompt() == MASTER_SYSTEM_PROMPT
+
+
+def test_estimate_tokens_counts_non_ascii_more_densely():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("ध्यान") > estimate_tokens("abcde")
+
+
+def test_teachings_are_dropped_lowest_ranked_first_when_over_budget(monkeypatch):
+    template = PromptTemplate("chat", "en", MASTER_SYSTEM_PROMPT)
+    full = template.render("hello", "peace", TEACHINGS)
+    assert full.dropped_teachings == 0 and not full.over_budget
+
+    # Leave room for everything but the second teaching
+    monkeypatch.setenv("PROMPT_TOKEN_BUDGET_CHAT", str(full.total_tokens - 1))
+    trimmed = PromptTemplate("chat", "en", MASTER_SYSTEM_PROMPT).render("hello", "peace", TEACHINGS)
+
+    assert trimmed.dropped_teachings == 1
+    assert TEACHINGS[0]["text"] in trimmed.user
+    assert TEACHINGS[1]["text"] not in trimmed.user
+    assert trimmed.total_tokens <= trimmed.budget
+
+
+def test_history_counts_against_the_budget_and_over_budget_is_reported(monkeypatch):
+    monkeypatch.setenv("PROMPT_TOKEN_BUDGET_CHAT", "50")
+    template = PromptTemplate("chat", "en", MASTER_SYSTEM_PROMPT)
+    history = [{"role": "user", "content": "x" * 400}] * 10
+    prompt = template.render("hello", None, TEACHINGS, history)
+
+    assert prompt.dropped_teachings == 2
+    assert "Relevant Osho teachings" not in prompt.user
+    assert prompt.tokens["history"] == 6 * 100
+    assert prompt.over_budget
+
+
+def test_stats_track_renders_and_drops(monkeypatch):
+    monkeypatch.setenv("PROMPT_TOKEN_BUDGET_CHAT", "50")
+    builder = PromptBuilder()
+    builder.render("chat", "hello", None, TEACHINGS)
+    builder.render("chat", "hello again", None, TEACHINGS)
+
+    stats = builder.stats()["chat"]
+    assert stats["renders"] == 2
+    assert stats["token_budget"] == 50
+    assert stats["dropped_teachings"] == 4
+    assert stats["over_budget"] == 2
@@ -0,0 +1,104 @@
+"""
+Tests for the memory-mapped index shared between uvicorn workers
+"""
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from services.shared_index import SharedIndex
+
+META = {"corpus": "abc", "model": "test-model"}
+
+
+def make_rows(count=4, dim=3):
+    embeddings = np.eye(count, dim, dtype=np.float32)
+    ids = [f"teaching_{i}" for i in range(count)]
+    documents = [f"text {i}" for i in range(count)]
+    metadatas = [
+        {"emotion": "anxiety" if i % 2 else "neutral", "source": f"source {i}", "theme": "t"}
+        for i in range(count)
+    ]
+    return ids, embeddings, documents, metadatas
+
+
+def test_ensure_builds_once_and_other_workers_attach(tmp_path):
+    calls = []
+
+    def builder(current):
+        calls.append(current)
+        return make_rows()
+
+    first = SharedIndex(str(tmp_path))
+    assert first.ensure(META, builder) is True
+
+    second = SharedIndex(str(tmp_path))
+    assert second.ensure(META, builder) is False
+    assert len(calls) == 1
+    assert second.loaded_generation == first.generation == 1
+    assert second.count() == 4
+
+
+def test_ensure_rebuilds_when_fingerprint_changes(tmp_path):
+    index = SharedIndex(str(tmp_path))
+    index.ensure(META, lambda current: make_rows())
+
+    seen = []
+
+    def builder(current):
+        seen.append(current)
+        return make_rows(count=2)
+
+    # Same model: the builder gets the current rows to diff against
+    restarted = SharedIndex(str(tmp_path))
+    assert restarted.ensure({"corpus": "changed", "model": "test-model"}, builder) is True
+    assert len(seen[0][0]) == 4
+    assert restarted.count() == 2
+
+    # New model: nothing can be reused, so the builder gets empty rows
+    restarted.ensure({"corpus": "changed", "model": "other-model"}, builder)
+    assert seen[1][0] == []
+
+
+def test_search_filters_by_emotion_and_orders_by_distance(tmp_path):
+    index = SharedIndex(str(tmp_path))
+    index.ensure(META, lambda current: make_rows())
+
+    query = np.array([0.0, 1.0, 0.1], dtype=np.float32)
+    assert [t["text"] for t in index.search(query, None, top_k=2)] == ["text 1", "text 3"]
+    assert [t["text"] for t in index.search(query, "anxiety", top_k=5)] == ["text 1", "text 3"]
+    # No teachings are tagged "peace", so the filter is dropped rather than returning nothing
+    assert index.search(query, "peace", top_k=2) == index.search(query, None, top_k=2)
+
+    batch = index.search_batch(np.stack([query, query]), [None, "anxiety"], top_k=1)
+    assert [[t["text"] for t in result] for result in batch] == [["text 1"], ["text 1"]]
+
+
+def test_refresh_sees_new_version_and_old_versions_are_pruned(tmp_path):
+    publisher = SharedIndex(str(tmp_path), keep_versions=2)
+    publisher.ensure(META, lambda current: make_rows())
+    worker = SharedIndex(str(tmp_path))
+    worker.attach()
+
+    assert worker.refresh() is False
+    publisher.publish(*make_rows(count=3))
+    publisher.publish(*make_rows(count=2))
+
+    assert worker.refresh() is True
+    assert worker.loaded_generation == 3
+    assert worker.count() == 2
+    assert publisher.versions() == [2, 3]
+    assert not os.path.exists(os.path.join(str(tmp_path), "v1"))
+
+
+def test_update_skips_publish_when_builder_reports_no_change(tmp_path):
+    index = SharedIndex(str(tmp_path))
+    index.ensure(META, lambda current: make_rows())
+
+    assert index.update(lambda current: None) == 1
+    assert index.update(lambda current: make_rows(count=1)) == 2
+
+    rows, meta = index.read_version(2)
+    assert rows[0] == ["teaching_0"]
+    assert meta == META
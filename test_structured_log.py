@@ -0,0 +1,43 @@
+"""
+Tests for the buffered structured logger
+"""
+import threading
+
+import pytest
+
+pytest.importorskip("orjson")
+
+from services.structured_log import StructuredLogger, _coalesce
+
+
+def test_identical_errors_are_coalesced_with_a_count():
+    batch = [
+        {"ts": 1.0, "event": "vector.search", "stage": "search", "error_class": "ValueError", "error": "bad"},
+        {"ts": 2.0, "event": "chat", "request_id": "a"},
+        {"ts": 3.0, "event": "vector.search", "stage": "search", "error_class": "ValueError", "error": "bad"},
+        {"ts": 4.0, "event": "vector.search", "stage": "search", "error_class": "KeyError", "error": "bad"},
+    ]
+    merged = _coalesce(batch)
+
+    assert [record["ts"] for record in merged] == [1.0, 2.0, 4.0]
+    assert merged[0]["count"] == 2 and merged[0]["last_ts"] == 3.0
+    assert "count" not in merged[2]
+
+
+def test_dropped_records_are_counted_across_threads(monkeypatch):
+    monkeypatch.setenv("LOG_QUEUE_SIZE", "1")
+    log = StructuredLogger()
+    log.close()
+
+    def flood():
+        for _ in range(1000):
+            log.error("vector.search", error=ValueError("bad"), stage="search")
+
+    threads = [threading.Thread(target=flood) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert log.queue.qsize() == 1
+    assert log.dropped == 8 * 1000 - 1
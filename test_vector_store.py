@@ -0,0 +1,150 @@
+"""
+Tests for incremental index rebuilds, rollback and version pruning
+"""
+import json
+import zlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("chromadb")
+
+from chromadb.api.client import SharedSystemClient
+
+from services import vector_store as vector_store_module
+from services.vector_store import OshoVectorStore
+
+
+class FakeEmbedding:
+    """
+    Deterministic 8-d embeddings that record every batch of texts embedded
+    """
+
+    MODEL_NAME = "fake-embedding"
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, input):
+        self.calls.append(list(input))
+        return [
+            np.random.default_rng(zlib.crc32(text.encode())).standard_normal(8).tolist()
+            for text in input
+        ]
+
+
+def teaching(i, text=None, emotion="peace"):
+    return {
+        "id": f"teaching_{i}",
+        "text": text or f"Teaching number {i}.",
+        "emotion": emotion,
+        "source": "Osho",
+        "theme": "awareness"
+    }
+
+
+@pytest.fixture
+def make_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store_module.embedding_functions, "DefaultEmbeddingFunction", FakeEmbedding)
+    corpus = tmp_path / "teachings.json"
+    monkeypatch.setenv("TEACHINGS_PATH", str(corpus))
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setenv("INDEX_KEEP_VERSIONS", "2")
+    monkeypatch.delenv("SHARED_INDEX_DIR", raising=False)
+    SharedSystemClient.clear_system_cache()
+    stores = []
+
+    def make(teachings, shared=False):
+        corpus.write_text(json.dumps(teachings), encoding="utf-8")
+        if shared:
+            monkeypatch.setenv("SHARED_INDEX_DIR", str(tmp_path / "shared"))
+        stores.append(OshoVectorStore())
+        return stores[-1]
+
+    yield make
+
+    # In-process Chroma clients share one in-memory database; leave it empty
+    for store in stores:
+        if store.client:
+            for collection in store.client.list_collections():
+                store.client.delete_collection(collection.name)
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_rebuild_embeds_only_new_or_edited_passages(make_store, shared):
+    store = make_store([teaching(i) for i in range(4)], shared=shared)
+    store.embedding_function.calls.clear()
+
+    corpus = [teaching(0), teaching(1, "An edited teaching."), teaching(3), teaching(4)]
+    version = store.rebuild(corpus)
+
+    assert store.embedding_function.calls == [["An edited teaching.", "Teaching number 4."]]
+    assert version == store.version == 2
+    found = store.search("query", query_embedding=np.asarray(FakeEmbedding()(["An edited teaching."])[0]), top_k=1)
+    assert found[0]["text"] == "An edited teaching."
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_unchanged_corpus_keeps_the_live_version(make_store, shared):
+    corpus = [teaching(i) for i in range(3)]
+    store = make_store(corpus, shared=shared)
+    store.embedding_function.calls.clear()
+
+    assert store.rebuild(corpus) == store.version == 1
+    assert store.embedding_function.calls == []
+
+
+def test_diff_rows_reuses_embeddings_by_id_and_text(make_store):
+    store = make_store([teaching(0)], shared=True)
+    current_embeddings = np.arange(16, dtype=np.float32).reshape(2, 8)
+    current = (
+        ["teaching_0", "teaching_1"],
+        current_embeddings,
+        ["Teaching number 0.", "Teaching number 1."],
+        [{"emotion": "peace"}, {"emotion": "peace"}]
+    )
+    store.embedding_function.calls.clear()
+
+    # Same text under a new id counts as new; a moved row keeps its embedding
+    ids, embeddings, documents, metadatas = store._diff_rows(
+        current, [teaching(1), teaching(5, "Teaching number 0.")]
+    )
+
+    assert ids == ["teaching_1", "teaching_5"]
+    assert store.embedding_function.calls == [["Teaching number 0."]]
+    assert np.array_equal(embeddings[0], current_embeddings[1])
+    assert metadatas[0] == {"emotion": "peace", "source": "Osho", "theme": "awareness"}
+
+
+def test_local_rollback_and_pruning(make_store):
+    store = make_store([teaching(0)])
+    for i in range(1, 4):
+        store.rebuild([teaching(j) for j in range(i + 1)])
+
+    assert store.versions() == [3, 4]
+    assert store.version == 4
+    live = {collection.name for collection in store.client.list_collections()}
+    assert live == {"osho_teachings_v3", "osho_teachings_v4"}
+
+    assert store.rollback(3) == store.version == 3
+    assert store.collection.count() == 3
+    with pytest.raises(KeyError):
+        store.rollback(1)
+
+    # A rebuild after a rollback gets a fresh version number, never reusing one
+    assert store.rebuild([teaching(9)]) == 5
+    assert store.versions() == [4, 5]
+
+
+def test_shared_rollback_republishes_the_old_rows(make_store):
+    store = make_store([teaching(0)], shared=True)
+    store.rebuild([teaching(0), teaching(1)])
+    store.embedding_function.calls.clear()
+
+    version = store.rollback(1)
+
+    assert version == store.version == 3
+    assert store.shared_index.count() == 1
+    assert store.embedding_function.calls == []
+    with pytest.raises(KeyError):
+        store.rollback(7)